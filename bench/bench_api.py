@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Round-trip benchmark of the freeboxvm subcommands against a local Freebox.
+
+bench/freebox_mock.py runs in a child process, with --latency ms added to
+every answer, and each subcommand runs in a fresh freeboxvm process pointed
+at it with --api-url. The mock is reset before each run, so every run
+starts from the same VMs and files. For every subcommand the benchmark
+reports the median wall-clock time, and the number of HTTP requests, TCP
+connections, websockets and logins seen by the mock.
+
+By default the session and the caches of freeboxvm are warmed up by a
+first unmeasured run; with --cold they are dropped before every run. With
+--agent the subcommands go through a `freeboxvm agent` started for the
+benchmark, whose own requests are counted.
+
+Usage: python bench/bench_api.py [--latency MS] [--task-delay SECONDS] [--runs N]
+                                 [--only NAME] [--cold] [--agent] [--json FILE]
+"""
+import os, sys
+import argparse, json
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(BENCH_DIR, "..", "freeboxvm")
+MOCK = os.path.join(BENCH_DIR, "freebox_mock.py")
+
+SCENARIOS = {
+    "system": [ "system" ],
+    "list": [ "list" ],
+    "show": [ "show", "vm1" ],
+    "poweron": [ "poweron", "vm1", "--wait" ],
+    "poweroff": [ "poweroff", "vm2", "--wait" ],
+    "reset": [ "reset", "vm2", "--wait" ],
+    "poweron-all": [ "poweron", "--all", "--status", "stopped", "--wait" ],
+    "delete": [ "delete", "vm1", "--disk" ],
+    "os-list": [ "os-list" ],
+    "disk-info": [ "disk", "info", "/Freebox/VMs/vm1.qcow2" ],
+    "disk-create": [ "disk", "create", "/Freebox/VMs/bench.qcow2", "1G" ],
+    "download": [ "download", "--url", "https://example.invalid/bench.iso" ],
+}
+
+def start_mock(args, tmpdir):
+    port_file = os.path.join(tmpdir, "port")
+    mock = subprocess.Popen([ sys.executable, MOCK, "--port-file", port_file,
+                              "--latency", str(args.latency), "--task-delay", str(args.task_delay),
+                              "--vms", str(args.vms) ], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(port_file):
+        if time.monotonic() > deadline or mock.poll() is not None:
+            mock.kill()
+            raise RuntimeError("la Freebox factice n'a pas démarré")
+        time.sleep(0.01)
+    with open(port_file) as f:
+        return mock, f"http://127.0.0.1:{f.read()}"
+
+def mock_call(url, path, method="GET"):
+    request = urllib.request.Request(url + path, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+def start_agent(freeboxvm, env, token_file):
+    agent = subprocess.Popen([ *freeboxvm, "agent" ], env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket_dir = os.path.join(env["XDG_RUNTIME_DIR"], "freeboxvm")
+    name = os.path.splitext(os.path.basename(token_file))[0] + "_agent.sock"
+    deadline = time.monotonic() + 10
+    while not os.path.exists(os.path.join(socket_dir, name)):
+        if time.monotonic() > deadline or agent.poll() is not None:
+            agent.kill()
+            raise RuntimeError("l'agent n'a pas démarré")
+        time.sleep(0.01)
+    return agent
+
+def run_scenario(cmd, freeboxvm, env, mock_url, args, cache_dir, token_file):
+    walls, stats = [ ], [ ]
+    if not args.cold:
+        mock_call(mock_url, "/__mock__/reset", "POST")
+        subprocess.run([ *freeboxvm, *cmd ], env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(args.runs):
+        if args.cold:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            session = os.path.splitext(token_file)[0] + "_session.json"
+            if os.path.exists(session):
+                os.unlink(session)
+        mock_call(mock_url, "/__mock__/reset", "POST")
+        start = time.perf_counter()
+        proc = subprocess.run([ *freeboxvm, *cmd ], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        walls.append(time.perf_counter() - start)
+        if proc.returncode:
+            raise RuntimeError(f"{' '.join(cmd)} a échoué ({proc.returncode}) :\n{proc.stderr}")
+        stats.append(mock_call(mock_url, "/__mock__/stats"))
+    last = stats[-1]
+    return {
+        "wall_ms": statistics.median(walls) * 1000,
+        "requests": statistics.median(s["requests"] for s in stats),
+        "connections": statistics.median(s["connections"] for s in stats),
+        "websockets": statistics.median(s["websockets"] for s in stats),
+        "logins": statistics.median(s["logins"] for s in stats),
+        "endpoints": last["endpoints"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des allers-retours des sous-commandes de freeboxvm")
+    parser.add_argument("--latency", metavar="MS", type=float, default=20,
+                        help="Délai ajouté à chaque réponse de la Freebox factice (défaut: %(default)s)")
+    parser.add_argument("--task-delay", metavar="SECONDES", type=float, default=0.2,
+                        help="Durée des changements d'état et des tâches (défaut: %(default)s)")
+    parser.add_argument("--vms", metavar="N", type=int, default=4,
+                        help="Nombre de VM de la Freebox factice (défaut: %(default)s)")
+    parser.add_argument("--runs", metavar="N", type=int, default=3,
+                        help="Nombre de lancements par sous-commande (défaut: %(default)s)")
+    parser.add_argument("--only", metavar="NOM", action="append", choices=[*SCENARIOS],
+                        help="Ne lancer que ce scénario (répétable)")
+    parser.add_argument("--cold", action="store_true",
+                        help="Effacer session et caches avant chaque lancement")
+    parser.add_argument("--agent", action="store_true",
+                        help="Passer par un agent freeboxvm")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="Détailler les requêtes par endpoint")
+    parser.add_argument("--json", metavar="FICHIER",
+                        help="Écrire aussi les résultats dans ce fichier JSON")
+    args = parser.parse_args()
+
+    results = { }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        mock, mock_url = start_mock(args, tmpdir)
+        cache_dir = os.path.join(tmpdir, "cache")
+        token_file = os.path.join(tmpdir, "bench.json")
+        env = dict(os.environ, XDG_CACHE_HOME=cache_dir, XDG_RUNTIME_DIR=tmpdir)
+        freeboxvm = [ sys.executable, SCRIPT, "--api-url", f"{mock_url}/api/v8",
+                      "--token-file", token_file ]
+        agent = None
+        try:
+            # authorize the application once
+            subprocess.run([ *freeboxvm, "--no-agent", "list" ], env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+            if args.agent:
+                agent = start_agent(freeboxvm, env, token_file)
+            else:
+                freeboxvm.append("--no-agent")
+
+            print(f"{'scénario':<12} {'total ms':>9} {'requêtes':>9} {'connexions':>11} "
+                  f"{'websockets':>11} {'logins':>7}")
+            for name, cmd in SCENARIOS.items():
+                if args.only and name not in args.only:
+                    continue
+                result = run_scenario(cmd, freeboxvm, env, mock_url, args, cache_dir, token_file)
+                results[name] = result
+                print(f"{name:<12} {result['wall_ms']:>9.1f} {result['requests']:>9g} "
+                      f"{result['connections']:>11g} {result['websockets']:>11g} {result['logins']:>7g}")
+                if args.verbose:
+                    for endpoint, count in sorted(result["endpoints"].items()):
+                        print(f"{'':<12} {count:>4} {endpoint}")
+        finally:
+            if agent:
+                agent.terminate()
+                agent.wait()
+            mock.terminate()
+            mock.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({ "latency_ms": args.latency, "task_delay": args.task_delay,
+                        "vms": args.vms, "runs": args.runs, "cold": args.cold,
+                        "agent": args.agent, "results": results }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Start-up time benchmark of the freeboxvm subcommands.
+
+Each subcommand runs in a fresh interpreter with `python -X importtime`,
+in two modes, so no Freebox is needed:
+
+  agent   talking to a local stand-in agent (see `freeboxvm agent`) that
+          answers the API calls with canned data
+  direct  calling bench/freebox_mock.py itself, with a cached session but
+          no cached data, which is the path that imports requests
+
+For every subcommand the benchmark reports the median wall-clock time of
+the process, the median time spent importing modules (those of the bare
+interpreter excluded) and the heavy modules that were loaded.
+
+The budgets of bench/startup_budget.json give, per mode and subcommand, the
+maximum import time in ms and the modules it must not load; the benchmark
+exits with status 1 when one is exceeded.
+
+Usage: python bench/bench_startup.py [--runs N] [--mode agent|direct]... [--only NAME]
+                                     [--budget FILE] [--no-budget] [--json FILE]
+"""
+import os, sys
+import argparse, json
+import compileall
+import shutil
+import socketserver
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, "..", "src")
+SCRIPT = os.path.join(BENCH_DIR, "..", "freeboxvm")
+MOCK = os.path.join(BENCH_DIR, "freebox_mock.py")
+DEFAULT_BUDGET = os.path.join(BENCH_DIR, "startup_budget.json")
+
+HEAVY_MODULES = [ "asyncio", "requests", "urllib3", "ssl", "websockets", "tqdm", "humanize",
+                  "concurrent.futures", "threading", "socket" ]
+
+SUBCOMMANDS = {
+    "help": [ "--help" ],
+    "system": [ "system" ],
+    "list": [ "list" ],
+    "show": [ "show", "1" ],
+    "poweron": [ "poweron", "1" ],
+    "poweroff": [ "poweroff", "2" ],
+    "reset": [ "reset", "2" ],
+}
+
+MODES = ("agent", "direct")
+
+VMS = [
+    { "id": 1, "name": "debian", "status": "stopped", "os": "debian", "mac": "00:00:00:00:00:01",
+      "vcpus": 1, "memory": 1024, "enable_screen": False, "disk_path": "", "disk_type": "qcow2" },
+    { "id": 2, "name": "ubuntu", "status": "running", "os": "ubuntu", "mac": "00:00:00:00:00:02",
+      "vcpus": 2, "memory": 2048, "enable_screen": True, "disk_path": "", "disk_type": "qcow2" },
+]
+
+SYSTEM_INFO = { "total_memory": 2048, "used_memory": 1024, "total_cpus": 2, "used_cpus": 1,
+                "usb_used": False, "usb_ports": [ "usb-external-type-a" ] }
+
+#
+# Stand-in agent
+#
+
+def api_result(method, endpoint):
+    if method != "get":
+        return True
+    if endpoint == "/vm/":
+        return VMS
+    if endpoint == "/vm/info/":
+        return SYSTEM_INFO
+    if endpoint.startswith("/vm/"):
+        return VMS[0]
+    return [ ]  # /fs/ls: no 'VMs' folder
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """Answer the JSON lines protocol of `freeboxvm agent`."""
+
+    def handle(self):
+        for line in self.rfile:
+            message = json.loads(line)
+            if message["op"] == "token":
+                reply = { "token": "bench" }
+            else:
+                reply = { "result": api_result(message["method"].lower(), message["endpoint"]) }
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+def agent_socket_path(token_file):
+    """Socket path where freeboxvm looks for the agent of `token_file`."""
+    sys.path.insert(0, SRC_DIR)
+    import freeboxvm
+    freeboxvm._session["token_file"] = token_file
+    return freeboxvm.runtime_socket_path("agent")
+
+def start_agent(token_file):
+    path = agent_socket_path(token_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    agent = socketserver.ThreadingUnixStreamServer(path, AgentHandler)
+    agent.daemon_threads = True
+    threading.Thread(target=agent.serve_forever, daemon=True).start()
+    return agent
+
+#
+# Stand-in Freebox
+#
+
+def start_mock(tmpdir):
+    port_file = os.path.join(tmpdir, "port")
+    mock = subprocess.Popen([ sys.executable, MOCK, "--port-file", port_file, "--latency", "0" ],
+                            stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(port_file):
+        if time.monotonic() > deadline or mock.poll() is not None:
+            mock.kill()
+            raise RuntimeError("la Freebox factice n'a pas démarré")
+        time.sleep(0.01)
+    with open(port_file) as f:
+        return mock, f"http://127.0.0.1:{f.read()}"
+
+def mock_reset(url):
+    urllib.request.urlopen(urllib.request.Request(url + "/__mock__/reset", method="POST")).close()
+
+#
+# Measures
+#
+
+def parse_importtime(stderr):
+    """Return {module: cumulative µs} for the top-level imports of a
+    `-X importtime` report, and the set of all imported modules."""
+    top, modules = { }, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            top[name.strip()] = int(cumulative)
+    return top, modules
+
+def run_once(argv, env, before=None):
+    if before:
+        before()
+    start = time.perf_counter()
+    proc = subprocess.run([ sys.executable, "-X", "importtime", *argv ], env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode not in (0, None):
+        errors = "\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))
+        raise RuntimeError(f"{' '.join(argv)} a échoué ({proc.returncode}) :\n{errors}")
+    top, modules = parse_importtime(proc.stderr)
+    return elapsed, top, modules
+
+def bench_subcommand(argv, env, baseline, runs, before=None):
+    walls, imports, loaded = [ ], [ ], set()
+    for _ in range(runs):
+        elapsed, top, modules = run_once(argv, env, before)
+        walls.append(elapsed)
+        imports.append(sum(us for name, us in top.items() if name not in baseline))
+        loaded |= modules
+    return {
+        "wall_ms": statistics.median(walls) * 1000,
+        "import_ms": statistics.median(imports) / 1000,
+        "heavy": [ m for m in HEAVY_MODULES
+                   if any(name == m or name.startswith(m + ".") for name in loaded) ],
+    }
+
+def check_budget(name, result, budget):
+    """Return the budget violations of a subcommand."""
+    errors = [ ]
+    limit = budget.get("import_ms")
+    if limit is not None and result["import_ms"] > limit:
+        errors.append(f"{name}: imports en {result['import_ms']:.1f} ms, budget {limit} ms")
+    for module in budget.get("forbidden", [ ]):
+        if module in result["heavy"]:
+            errors.append(f"{name}: charge {module}")
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage des sous-commandes de freeboxvm")
+    parser.add_argument("--runs", metavar="N", type=int, default=5,
+                        help="Nombre de lancements par sous-commande (défaut: %(default)s)")
+    parser.add_argument("--mode", action="append", choices=MODES,
+                        help="Ne mesurer que ce mode (répétable, défaut: les deux)")
+    parser.add_argument("--only", metavar="NOM", action="append", choices=[*SUBCOMMANDS],
+                        help="Ne mesurer que cette sous-commande (répétable)")
+    parser.add_argument("--budget", metavar="FICHIER", default=DEFAULT_BUDGET,
+                        help="Budgets par mode et sous-commande (défaut: bench/startup_budget.json)")
+    parser.add_argument("--no-budget", action="store_true",
+                        help="Mesurer sans vérifier les budgets")
+    parser.add_argument("--json", metavar="FICHIER",
+                        help="Écrire aussi les résultats dans ce fichier JSON")
+    args = parser.parse_args()
+
+    budgets = { }
+    if not args.no_budget:
+        with open(args.budget) as f:
+            budgets = json.load(f)
+
+    # measure with up-to-date bytecode, not a compilation of the sources
+    compileall.compile_dir(SRC_DIR, quiet=1)
+
+    # modules of the bare interpreter, loaded whatever the subcommand
+    baseline = set(parse_importtime(subprocess.run(
+        [ sys.executable, "-X", "importtime", "-c", "pass" ],
+        stderr=subprocess.PIPE, text=True).stderr)[0])
+
+    results, errors = { mode: { } for mode in args.mode or MODES }, [ ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache_dir = os.path.join(tmpdir, "cache")
+        env = dict(os.environ, XDG_RUNTIME_DIR=tmpdir, XDG_CACHE_HOME=cache_dir, HOME=tmpdir)
+        os.environ.update(env)
+        agent = mock = None
+
+        print(f"{'mode':<7} {'commande':<10} {'total ms':>9} {'imports ms':>11} {'budget ms':>10}  "
+              f"modules lourds")
+        try:
+            for mode in results:
+                token_file = os.path.join(tmpdir, f"{mode}.json")
+                before = None
+                if mode == "agent":
+                    agent = start_agent(token_file)
+                    freeboxvm = [ SCRIPT, "--token-file", token_file ]
+                else:
+                    mock, mock_url = start_mock(tmpdir)
+                    freeboxvm = [ SCRIPT, "--api-url", f"{mock_url}/api/v8",
+                                  "--token-file", token_file, "--no-agent" ]
+                    # authorize the application and cache the session once
+                    subprocess.run([ sys.executable, *freeboxvm, "list" ], env=env, check=True,
+                                   stdout=subprocess.DEVNULL)
+
+                    def before():
+                        mock_reset(mock_url)
+                        shutil.rmtree(cache_dir, ignore_errors=True)
+
+                for name, cmd in SUBCOMMANDS.items():
+                    if args.only and name not in args.only:
+                        continue
+                    result = bench_subcommand([ *freeboxvm, *cmd ], env, baseline, args.runs, before)
+                    budget = budgets.get(mode, { }).get(name, { })
+                    print(f"{mode:<7} {name:<10} {result['wall_ms']:>9.1f} {result['import_ms']:>11.1f} "
+                          f"{budget.get('import_ms', '-'):>10}  {', '.join(result['heavy']) or '-'}")
+                    results[mode][name] = result
+                    errors += check_budget(f"{mode} {name}", result, budget)
+        finally:
+            if agent:
+                agent.shutdown()
+                agent.server_close()
+            if mock:
+                mock.terminate()
+                mock.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({ "runs": args.runs, "python": sys.version.split()[0],
+                        "results": results }, f, indent=2)
+
+    if errors:
+        print("\nBudgets dépassés :", file=sys.stderr)
+        for error in errors:
+            print(f"  {error}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Throughput and latency benchmarks of the freeboxvm VNC and console transports.
+
+A local stand-in server imitates the Freebox /vm/{id}/vnc and
+/vm/{id}/console websocket endpoints, with the 'binary' or 'base64'
+subprotocol. The real transport code of freeboxvm (run_vnc_proxy() and
+console_link()) runs in a child process, pointed at the stand-in server
+through freeboxvm.WS_URL, and is driven with synthetic payloads:
+
+  vnc-down     framebuffer updates sent by the server to the VNC client
+  vnc-up       bulk data sent by the VNC client to the server
+  vnc-echo     small RFB pointer events echoed back by the server
+  console-rx   console output written by console_link() to its stdout
+  console-keys keystrokes typed on console_link() stdin and echoed back,
+               one every --key-interval ms like a fast typist
+
+Throughput scenarios report MiB/s, echo scenarios report round-trip latency
+percentiles, and all report the CPU time used by the freeboxvm process
+(including its start-up, about the same in every scenario).
+
+Usage: python bench/bench_transport.py [--mib N] [--frame KIB] [--keys N] [--key-interval MS]
+                                       [--proto binary|base64]... [--only NAME]
+                                       [--json FILE]
+"""
+import os, sys
+import argparse, json
+import asyncio
+import base64
+import signal
+import socket
+import statistics
+import subprocess
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+VM_ID = 1
+SESSION_TOKEN = "bench"
+CTRL_B_DETACH = b"\x02d"
+
+#
+# Child processes
+#
+
+def serve(port_file, proto, mode, size, count):
+    """Run the stand-in Freebox websocket server.
+
+    mode 'down' sends `count` messages of `size` bytes then closes, 'up'
+    reads `size` * `count` bytes then closes, 'echo' echoes every message.
+    The listening port is written to `port_file`.
+    """
+    from websockets.asyncio.server import serve as ws_serve
+
+    async def handler(ws):
+        parts = ws.request.path.split("/")
+        if parts[:4] != ["", "api", "v8", "vm"] or parts[-1] not in ("vnc", "console"):
+            await ws.close(1008, "unknown endpoint")
+            return
+        if mode == "down":
+            payload = os.urandom(size)
+            msg = base64.b64encode(payload).decode("ascii") if proto == "base64" else payload
+            for _ in range(count):
+                await ws.send(msg)
+            await ws.close()
+        elif mode == "up":
+            received = 0
+            async for msg in ws:
+                received += len(base64.b64decode(msg)) if proto == "base64" else len(msg)
+                if received >= size * count:
+                    break
+            await ws.close()
+        else:
+            async for msg in ws:
+                await ws.send(msg)
+
+    async def main():
+        async with ws_serve(handler, "127.0.0.1", 0, subprotocols=[proto],
+                            max_size=None, compression=None) as server:
+            with open(port_file + ".tmp", "w") as f:
+                f.write(str(server.sockets[0].getsockname()[1]))
+            os.rename(port_file + ".tmp", port_file)
+            await asyncio.Future()
+
+    asyncio.run(main())
+
+def freeboxvm_module(ws_url):
+    sys.path.insert(0, SRC_DIR)
+    import freeboxvm
+    freeboxvm.WS_URL = ws_url
+    return freeboxvm
+
+def run_vnc(ws_url, port):
+    """Run the VNC proxy of freeboxvm until SIGTERM."""
+    freeboxvm = freeboxvm_module(ws_url)
+    asyncio.run(freeboxvm.run_vnc_proxy(SESSION_TOKEN, VM_ID, "127.0.0.1", port))
+
+def run_console(ws_url):
+    """Run the console of freeboxvm on stdin/stdout until detached."""
+    freeboxvm = freeboxvm_module(ws_url)
+    asyncio.run(freeboxvm.console_link(SESSION_TOKEN, VM_ID))
+
+#
+# Driver
+#
+
+def start_server(proto, mode, size, count, tmpdir):
+    port_file = os.path.join(tmpdir, "port")
+    if os.path.exists(port_file):
+        os.unlink(port_file)
+    server = subprocess.Popen([sys.executable, __file__, "--serve", port_file, proto, mode,
+                               str(size), str(count)])
+    deadline = time.monotonic() + 10
+    while not os.path.exists(port_file):
+        if time.monotonic() > deadline or server.poll() is not None:
+            server.kill()
+            raise RuntimeError("le serveur de test n'a pas démarré")
+        time.sleep(0.01)
+    with open(port_file) as f:
+        return server, f"ws://127.0.0.1:{f.read()}/api/v8"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def connect_proxy(port):
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            return socket.create_connection(("127.0.0.1", port))
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+def wait_cpu(child, timeout=10):
+    """Wait for a child process, killed after `timeout` seconds, and return
+    its CPU time (user + system)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        pid, status, usage = os.wait4(child.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.monotonic() > deadline:
+            child.kill()
+        time.sleep(0.01)
+    child.returncode = os.waitstatus_to_exitcode(status)
+    return usage.ru_utime + usage.ru_stime
+
+def recv_until_eof(sock, limit=None):
+    received = 0
+    buf = bytearray(1 << 20)
+    while limit is None or received < limit:
+        n = sock.recv_into(buf)
+        if not n:
+            break
+        received += n
+    return received
+
+def recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+def latencies(samples):
+    q = statistics.quantiles(samples, n=100)
+    return { "p50_ms": q[49] * 1000, "p90_ms": q[89] * 1000, "p99_ms": q[98] * 1000 }
+
+def bench_vnc(scenario, proto, args, tmpdir):
+    frame = args.frame * 1024
+    if scenario == "vnc-echo":
+        mode, size, count = "echo", 0, 0
+    else:
+        mode, size, count = scenario[4:], frame, args.mib * 1024 * 1024 // frame
+    server, ws_url = start_server(proto, mode, size, count, tmpdir)
+    port = free_port()
+    proxy = subprocess.Popen([sys.executable, __file__, "--vnc", ws_url, str(port)],
+                             stdout=subprocess.DEVNULL)
+    try:
+        sock = connect_proxy(port)
+        result = { }
+        start = time.perf_counter()
+        if mode == "down":
+            total = recv_until_eof(sock)
+        elif mode == "up":
+            chunk = os.urandom(frame)
+            for _ in range(count):
+                sock.sendall(chunk)
+            sock.shutdown(socket.SHUT_WR)
+            recv_until_eof(sock)
+            total = size * count
+        else:
+            # PointerEvent: message type 5, button mask, x, y
+            samples = [ ]
+            for i in range(args.keys):
+                event = bytes([5, 0]) + (i % 1024).to_bytes(2, "big") + (i % 768).to_bytes(2, "big")
+                t = time.perf_counter()
+                sock.sendall(event)
+                recv_exact(sock, len(event))
+                samples.append(time.perf_counter() - t)
+            result.update(latencies(samples))
+            total = None
+            # let the proxy close the session before stopping it
+            sock.shutdown(socket.SHUT_WR)
+            recv_until_eof(sock)
+        elapsed = time.perf_counter() - start
+        sock.close()
+        if total is not None:
+            result["mib_s"] = total / elapsed / (1 << 20)
+    finally:
+        proxy.send_signal(signal.SIGTERM)
+        cpu = wait_cpu(proxy)
+        server.kill()
+        server.wait()
+    result["cpu_s"] = cpu
+    return result
+
+def bench_console(scenario, proto, args, tmpdir):
+    frame = 4096  # console output comes in small chunks
+    if scenario == "console-rx":
+        mode, count = "down", args.mib * 1024 * 1024 // frame
+    else:
+        mode, count = "echo", 0
+    server, ws_url = start_server(proto, mode, frame, count, tmpdir)
+    console = subprocess.Popen([sys.executable, __file__, "--console", ws_url],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+    try:
+        result = { }
+        if mode == "down":
+            start = time.perf_counter()
+            total = 0
+            while total < frame * count:
+                data = console.stdout.read(1 << 20)
+                if not data:
+                    break
+                total += len(data)
+            result["mib_s"] = total / (time.perf_counter() - start) / (1 << 20)
+        else:
+            samples = [ ]
+            for i in range(args.keys):
+                key = bytes([ord("a") + i % 26])
+                t = time.perf_counter()
+                console.stdin.write(key)
+                if console.stdout.read(1) != key:
+                    raise RuntimeError("écho de la console inattendu")
+                samples.append(time.perf_counter() - t)
+                time.sleep(args.key_interval / 1000)
+            result.update(latencies(samples))
+        try:
+            console.stdin.write(CTRL_B_DETACH)
+            console.stdin.close()
+        except BrokenPipeError:
+            pass  # already ended with its output
+    finally:
+        cpu = wait_cpu(console)
+        server.kill()
+        server.wait()
+    result["cpu_s"] = cpu
+    return result
+
+SCENARIOS = {
+    "vnc-down": bench_vnc,
+    "vnc-up": bench_vnc,
+    "vnc-echo": bench_vnc,
+    "console-rx": bench_console,
+    "console-keys": bench_console,
+}
+
+def print_result(scenario, proto, result):
+    def col(key, fmt):
+        return format(result[key], fmt) if key in result else "-"
+    print(f"{scenario:<14} {proto:<7} {col('mib_s', '.1f'):>8} {col('p50_ms', '.3f'):>8} "
+          f"{col('p90_ms', '.3f'):>8} {col('p99_ms', '.3f'):>8} {col('cpu_s', '.2f'):>7}")
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("--serve", "--vnc", "--console"):
+        role, params = sys.argv[1], sys.argv[2:]
+        if role == "--serve":
+            serve(params[0], params[1], params[2], int(params[3]), int(params[4]))
+        elif role == "--vnc":
+            run_vnc(params[0], int(params[1]))
+        else:
+            run_console(params[0])
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmarks des transports VNC et console de freeboxvm")
+    parser.add_argument("--mib", type=int, default=64,
+                        help="Volume transféré par scénario de débit, en Mio (défaut: %(default)s)")
+    parser.add_argument("--frame", metavar="KIO", type=int, default=64,
+                        help="Taille des messages VNC, en Kio (défaut: %(default)s)")
+    parser.add_argument("--keys", metavar="N", type=int, default=500,
+                        help="Nombre d'échanges des scénarios de latence (défaut: %(default)s)")
+    parser.add_argument("--key-interval", metavar="MS", type=float, default=20,
+                        help="Délai entre deux frappes de console-keys, en ms (défaut: %(default)s)")
+    parser.add_argument("--proto", action="append", choices=["binary", "base64"],
+                        help="Sous-protocole WebSocket (répétable, défaut: les deux)")
+    parser.add_argument("--only", metavar="NOM", action="append", choices=list(SCENARIOS),
+                        help="Ne lancer que ce scénario (répétable)")
+    parser.add_argument("--json", metavar="FICHIER",
+                        help="Écrire aussi les résultats dans ce fichier JSON")
+    args = parser.parse_args()
+
+    import tempfile
+    results = [ ]
+    print(f"{'scenario':<14} {'proto':<7} {'MiB/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'CPU s':>7}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for scenario, bench in SCENARIOS.items():
+            if args.only and scenario not in args.only:
+                continue
+            # the console endpoint only speaks 'binary'
+            protos = ["binary"] if scenario.startswith("console") else (args.proto or ["binary", "base64"])
+            for proto in protos:
+                result = bench(scenario, proto, args, tmpdir)
+                print_result(scenario, proto, result)
+                results.append({ "scenario": scenario, "proto": proto, **result })
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({ "mib": args.mib, "frame_kib": args.frame, "keys": args.keys,
+                        "key_interval_ms": args.key_interval,
+                        "results": results }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
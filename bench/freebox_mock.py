@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Freebox OS API, to run freeboxvm without a Freebox.
+
+The endpoints used by freeboxvm are served on a single port, over HTTP/1.1
+with keep-alive and with the /ws/event/ websocket:
+
+  /login/authorize/, /login/session/   application authorization (granted
+                                       at once) and sessions
+  /vm/, /vm/{id}, /vm/{id}/{action}    VMs, whose state changes take
+                                       --task-delay seconds
+  /vm/info/, /vm/distros/              system information, cloud images
+  /vm/disk/{create,resize,info,task}   disk images and their tasks
+  /fs/ls/{path}, /fs/rm/               a small file tree
+  /downloads/                          download tasks, done after --task-delay
+  /ws/event/                           vm_state_changed, vm_disk_task_done
+                                       and download_task_done notifications
+
+Every answer is delayed by --latency ms, like a round trip to a real
+Freebox. The requests are counted: GET /__mock__/stats returns the number
+of API requests (by endpoint), TCP connections, websockets and logins,
+and POST /__mock__/reset restores the initial VMs, files and counters
+(sessions are kept).
+
+Usage: python bench/freebox_mock.py [--listen ADDR] [--port N] [--latency MS]
+                                    [--task-delay SECONDS] [--vms N]
+                                    [--port-file FILE]
+
+then: freeboxvm --api-url http://127.0.0.1:PORT/api/v8 --token-file /tmp/mock.json list
+"""
+import os
+import argparse, json
+import asyncio
+import base64
+import hashlib, hmac
+import re
+import urllib.parse
+
+API_PREFIX = "/api/v8"
+
+DISTROS = [
+    { "name": "Debian 12 (Bookworm)", "os": "debian",
+      "url": "https://cloud.debian.org/images/cloud/bookworm/latest/debian-12-generic-arm64.qcow2",
+      "hash": "https://cloud.debian.org/images/cloud/bookworm/latest/SHA512SUMS" },
+    { "name": "Ubuntu 24.04 (Noble Numbat)", "os": "ubuntu",
+      "url": "https://cloud-images.ubuntu.com/noble/current/noble-server-cloudimg-arm64.img",
+      "hash": "https://cloud-images.ubuntu.com/noble/current/SHA256SUMS" },
+]
+
+DOWNLOAD_DIR = "/Freebox/Téléchargements"
+VMS_DIR = "/Freebox/VMs"
+DISK_SIZE = 10 << 30
+DOWNLOAD_SIZE = 600 << 20
+
+# Mock state, see reset()
+_mock = { "latency": 0.0, "task_delay": 0.2, "vms": 2,
+          "apps": { }, "sessions": set(), "subscribers": { } }
+
+class MockError(Exception):
+    """An API error, answered with `status` and a Freebox error payload."""
+
+    def __init__(self, status, error_code, msg):
+        super().__init__(msg)
+        self.status, self.error_code, self.msg = status, error_code, msg
+
+def b64(path):
+    return base64.b64encode(path.encode("utf-8")).decode("ascii")
+
+def unb64(path_b64):
+    try:
+        return base64.b64decode(path_b64).decode("utf-8")
+    except ValueError:
+        raise MockError(200, "invalid_request", "chemin invalide")
+
+def reset():
+    """Restore the initial VMs, files, tasks and counters."""
+    vms = { }
+    files = { "/": None, "/Freebox": None, VMS_DIR: None, DOWNLOAD_DIR: None }
+    for vm_id in range(1, _mock["vms"] + 1):
+        name = f"vm{vm_id}"
+        disk = f"{VMS_DIR}/{name}.qcow2"
+        files[disk] = DISK_SIZE
+        vms[vm_id] = {
+            "id": vm_id, "name": name, "status": "running" if vm_id % 2 == 0 else "stopped",
+            "os": "debian", "mac": f"02:00:00:00:00:{vm_id:02x}", "vcpus": 1, "memory": 1024,
+            "enable_screen": False, "disk_type": "qcow2", "disk_path": b64(disk), "cd_path": "",
+            "bind_usb_ports": [ ], "enable_cloudinit": False, "cloudinit_hostname": "",
+            "cloudinit_userdata": "",
+        }
+    _mock.update(vm_list=vms, files=files, downloads={ }, disk_tasks={ }, next_id=100,
+                 stats={ "requests": 0, "endpoints": { }, "connections": 0,
+                         "websockets": 0, "logins": 0 })
+    # clients following the events (e.g. an agent) see the restored states
+    for vm in vms.values():
+        notify("vm_state_changed", "vm", "state_changed", { "id": vm["id"], "status": vm["status"] })
+
+def next_id():
+    _mock["next_id"] += 1
+    return _mock["next_id"]
+
+def later(callback, *args):
+    asyncio.get_running_loop().call_later(_mock["task_delay"], callback, *args)
+
+def notify(event, source, name, result):
+    """Send a notification to the websockets registered to `event`."""
+    message = { "action": "notification", "success": True, "source": source,
+                "event": name, "result": result }
+    for send, events in _mock["subscribers"].values():
+        if event in events:
+            send(message)
+
+#
+# Endpoints
+#
+
+def login_authorize(match, body):
+    track_id = next_id()
+    app_token = os.urandom(32).hex()
+    _mock["apps"][track_id] = { "app_token": app_token, "challenge": None }
+    return { "app_token": app_token, "track_id": track_id }
+
+def login_authorize_status(match, body):
+    app = _mock["apps"].get(int(match[1]))
+    if app is None:
+        return { "status": "unknown" }
+    app["challenge"] = os.urandom(16).hex()
+    return { "status": "granted", "challenge": app["challenge"] }
+
+def login_session(match, body):
+    for app in _mock["apps"].values():
+        if app["challenge"] is None:
+            continue
+        password = hmac.new(app["app_token"].encode(), app["challenge"].encode(),
+                            hashlib.sha1).hexdigest()
+        if hmac.compare_digest(password, str(body.get("password", ""))):
+            session_token = os.urandom(24).hex()
+            _mock["sessions"].add(session_token)
+            _mock["stats"]["logins"] += 1
+            return { "session_token": session_token, "permissions": { "vm": True } }
+    raise MockError(403, "invalid_token", "mot de passe invalide")
+
+def vm_info(match, body):
+    running = [ vm for vm in _mock["vm_list"].values() if vm["status"] != "stopped" ]
+    return { "total_memory": 15360, "used_memory": sum(vm["memory"] for vm in running),
+             "total_cpus": 4, "used_cpus": sum(vm["vcpus"] for vm in running),
+             "usb_used": False, "usb_ports": [ "usb-external-type-a", "usb-external-type-c" ] }
+
+def vm_distros(match, body):
+    return DISTROS
+
+def vm_list(match, body):
+    return [ *_mock["vm_list"].values() ]
+
+def vm_get(match, body):
+    vm = _mock["vm_list"].get(int(match[1]))
+    if vm is None:
+        raise MockError(200, "noent", "VM introuvable")
+    return vm
+
+def vm_create(match, body):
+    vm = dict(next(iter(_mock["vm_list"].values()), { }), **body)
+    vm.update(id=next_id(), status="stopped", mac=f"02:00:00:00:01:{len(_mock['vm_list']):02x}")
+    _mock["vm_list"][vm["id"]] = vm
+    return vm
+
+def vm_delete(match, body):
+    vm = vm_get(match, body)
+    del _mock["vm_list"][vm["id"]]
+    return None
+
+def vm_set_status(vm, status):
+    vm["status"] = status
+    notify("vm_state_changed", "vm", "state_changed", { "id": vm["id"], "status": status })
+
+def vm_action(match, body):
+    vm = vm_get(match, body)
+    final = { "start": "running", "restart": "running" }.get(match[2], "stopped")
+    vm_set_status(vm, "starting" if final == "running" else "stopping")
+    later(vm_set_status, vm, final)
+    return None
+
+def disk_info(match, body):
+    path = unb64(body.get("disk_path", ""))
+    size = _mock["files"].get(path)
+    if size is None:
+        raise MockError(200, "noent", "image disque introuvable")
+    return { "type": "qcow2", "virtual_size": size, "actual_size": size // 8 }
+
+def disk_task(match, body):
+    path = unb64(body.get("disk_path", ""))
+    if match[1] == "resize" and _mock["files"].get(path) is None:
+        raise MockError(200, "noent", "image disque introuvable")
+    task_id = next_id()
+    _mock["disk_tasks"][task_id] = { "id": task_id, "type": match[1], "done": False, "error": False }
+
+    def done():
+        _mock["files"][path] = int(body.get("size", DISK_SIZE))
+        _mock["disk_tasks"][task_id]["done"] = True
+        notify("vm_disk_task_done", "vm", "disk_task_done", _mock["disk_tasks"][task_id])
+
+    later(done)
+    return { "id": task_id }
+
+def disk_task_get(match, body):
+    task = _mock["disk_tasks"].get(int(match[1]))
+    if task is None:
+        raise MockError(200, "noent", "tâche introuvable")
+    return task
+
+def disk_task_delete(match, body):
+    _mock["disk_tasks"].pop(int(match[1]), None)
+    return None
+
+def fs_ls(match, body):
+    path = unb64(urllib.parse.unquote(match[1])).rstrip("/") or "/"
+    if path not in _mock["files"] or _mock["files"][path] is not None:
+        raise MockError(200, "path_not_found", "dossier introuvable")
+    only_folder = str(body.get("onlyFolder", "")).lower() in ("1", "true")
+    entries = [ ]
+    for child, size in sorted(_mock["files"].items()):
+        if child == "/" or os.path.dirname(child) != path:
+            continue
+        if only_folder and size is not None:
+            continue
+        entries.append({ "name": os.path.basename(child), "path": b64(child), "hidden": False,
+                         "type": "dir" if size is None else "file",
+                         "mimetype": "inode/directory" if size is None else "application/octet-stream",
+                         "size": size or 0 })
+    return entries
+
+def fs_rm(match, body):
+    for path_b64 in body.get("files", [ ]):
+        _mock["files"].pop(unb64(path_b64), None)
+    return { "id": next_id(), "state": "done", "type": "rm" }
+
+def download_add(match, body):
+    url = body.get("download_url")
+    if not url:
+        raise MockError(200, "invalid_request", "download_url manquant")
+    directory = unb64(body["download_dir"]) if body.get("download_dir") else DOWNLOAD_DIR
+    name = body.get("filename") or os.path.basename(urllib.parse.urlsplit(url).path) or "download"
+    task_id = next_id()
+    task = { "id": task_id, "name": name, "status": "downloading", "size": DOWNLOAD_SIZE,
+             "rx_bytes": 0, "download_dir": b64(directory),
+             "started": asyncio.get_running_loop().time() }
+    _mock["downloads"][task_id] = task
+
+    def done():
+        if _mock["downloads"].get(task_id) is task:
+            task.update(status="done", rx_bytes=task["size"])
+            _mock["files"][f"{directory}/{name}"] = task["size"]
+            notify("download_task_done", "download", "task_done", download_view(task))
+
+    later(done)
+    return { "id": task_id }
+
+def download_view(task):
+    if task["status"] == "downloading":
+        elapsed = asyncio.get_running_loop().time() - task["started"]
+        task["rx_bytes"] = min(task["size"], int(task["size"] * elapsed / max(_mock["task_delay"], 1e-3)))
+    return { key: value for key, value in task.items() if key != "started" }
+
+def download_list(match, body):
+    return [ download_view(task) for task in _mock["downloads"].values() ]
+
+def download_get(match, body):
+    task = _mock["downloads"].get(int(match[1]))
+    if task is None:
+        raise MockError(200, "noent", "tâche introuvable")
+    return download_view(task)
+
+def download_delete(match, body):
+    task = _mock["downloads"].pop(int(match[1]), None)
+    if task is not None and match[2]:
+        _mock["files"].pop(f"{unb64(task['download_dir'])}/{task['name']}", None)
+    return None
+
+ROUTES = [
+    ("POST", r"/login/authorize/", login_authorize, False),
+    ("GET", r"/login/authorize/(\d+)", login_authorize_status, False),
+    ("POST", r"/login/session/", login_session, False),
+    ("GET", r"/vm/info/", vm_info, True),
+    ("GET", r"/vm/distros/", vm_distros, True),
+    ("GET", r"/vm/", vm_list, True),
+    ("POST", r"/vm/", vm_create, True),
+    ("POST", r"/vm/disk/info", disk_info, True),
+    ("POST", r"/vm/disk/(create|resize)", disk_task, True),
+    ("GET", r"/vm/disk/task/(\d+)", disk_task_get, True),
+    ("DELETE", r"/vm/disk/task/(\d+)", disk_task_delete, True),
+    ("GET", r"/vm/(\d+)", vm_get, True),
+    ("DELETE", r"/vm/(\d+)", vm_delete, True),
+    ("POST", r"/vm/(\d+)/(start|stop|powerbutton|restart)", vm_action, True),
+    ("GET", r"/fs/ls/([^/]*)", fs_ls, True),
+    ("POST", r"/fs/rm/", fs_rm, True),
+    ("POST", r"/downloads/add", download_add, True),
+    ("GET", r"/downloads/", download_list, True),
+    ("GET", r"/downloads/(\d+)", download_get, True),
+    ("DELETE", r"/downloads/(\d+)(/erase)?", download_delete, True),
+]
+
+def endpoint_name(method, path):
+    """Endpoint of a request for the statistics, without ids and paths."""
+    path = re.sub(r"/fs/ls/[^/]*", "/fs/ls/{path}", path)
+    path = re.sub(r"/\d+", "/{id}", path)
+    return f"{method} {path}"
+
+def parse_body(headers, body):
+    if not body:
+        return { }
+    if headers.get("content-type", "").startswith("application/json"):
+        return json.loads(body)
+    return { key: values[-1] for key, values in urllib.parse.parse_qs(body.decode("utf-8")).items() }
+
+async def api_answer(method, target, headers, body):
+    """Return the HTTP status and JSON payload answering a request."""
+    path = urllib.parse.urlsplit(target).path
+    if path == "/__mock__/stats":
+        return 200, _mock["stats"]
+    if path == "/__mock__/reset" and method == "POST":
+        reset()
+        return 200, { "success": True }
+
+    stats = _mock["stats"]
+    stats["requests"] += 1
+    endpoint = path[len(API_PREFIX):] if path.startswith(API_PREFIX + "/") else None
+    name = endpoint_name(method, endpoint or path)
+    stats["endpoints"][name] = stats["endpoints"].get(name, 0) + 1
+    await asyncio.sleep(_mock["latency"])
+
+    try:
+        for route_method, pattern, handler, auth in ROUTES:
+            match = re.fullmatch(pattern, endpoint or "")
+            if match and route_method == method:
+                break
+        else:
+            raise MockError(404, "invalid_request", f"point d'accès inconnu : {method} {path}")
+        if auth and headers.get("x-fbx-app-auth") not in _mock["sessions"]:
+            raise MockError(403, "auth_required", "session invalide")
+        try:
+            result = handler(match, parse_body(headers, body))
+        except (ValueError, TypeError, KeyError) as e:
+            raise MockError(200, "invalid_request", f"requête invalide : {e}")
+    except MockError as e:
+        return e.status, { "success": False, "error_code": e.error_code, "msg": e.msg }
+    payload = { "success": True }
+    if result is not None:
+        payload["result"] = result
+    return 200, payload
+
+#
+# Connections
+#
+
+REASONS = { 101: "Switching Protocols", 200: "OK", 403: "Forbidden", 404: "Not Found" }
+
+async def serve_events(head, reader, writer, headers):
+    """Serve the /ws/event/ websocket on an upgraded connection."""
+    from websockets.frames import Opcode
+    from websockets.protocol import State
+    from websockets.server import ServerProtocol
+
+    protocol = ServerProtocol()
+    protocol.receive_data(head)
+    request = protocol.events_received()[0]
+    if headers.get("x-fbx-app-auth") in _mock["sessions"]:
+        response = protocol.accept(request)
+    else:
+        response = protocol.reject(403, "session invalide\n")
+    protocol.send_response(response)
+
+    def flush():
+        for data in protocol.data_to_send():
+            if data:
+                writer.write(data)
+            elif writer.can_write_eof():
+                writer.write_eof()
+
+    def send(message):
+        if protocol.state is State.OPEN:
+            protocol.send_text(json.dumps(message).encode("utf-8"))
+            flush()
+
+    await asyncio.sleep(_mock["latency"])
+    flush()
+    if response.status_code != 101:
+        return
+    _mock["stats"]["websockets"] += 1
+    key = object()
+    try:
+        while protocol.state is not State.CLOSED:
+            data = await reader.read(65536)
+            if data:
+                protocol.receive_data(data)
+            else:
+                protocol.receive_eof()
+            for frame in protocol.events_received():
+                if frame.opcode is not Opcode.TEXT:
+                    continue
+                try:
+                    message = json.loads(frame.data)
+                except ValueError:
+                    continue
+                if message.get("action") == "register":
+                    _mock["subscribers"][key] = (send, set(message.get("events", [ ])))
+                    send({ "action": "register", "success": True })
+            flush()
+            if not data:
+                break
+    finally:
+        _mock["subscribers"].pop(key, None)
+
+async def serve_connection(reader, writer):
+    """Serve HTTP/1.1 requests, with keep-alive, on a TCP connection."""
+    counted = False
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *lines = head.decode("latin-1").split("\r\n")[:-2]
+            method, target, _ = request_line.split(" ", 2)
+            headers = { }
+            for line in lines:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            if not counted and not target.startswith("/__mock__/"):
+                _mock["stats"]["connections"] += 1
+                counted = True
+
+            if headers.get("upgrade", "").lower() == "websocket":
+                if urllib.parse.urlsplit(target).path == f"{API_PREFIX}/ws/event/":
+                    await serve_events(head, reader, writer, headers)
+                    break
+                status, payload = 404, { "success": False, "error_code": "invalid_request",
+                                         "msg": "websocket inconnue" }
+            else:
+                status, payload = await api_answer(method, target, headers, body)
+
+            data = json.dumps(payload).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                         f"Content-Type: application/json\r\n"
+                         f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, port_file=None):
+    reset()
+    server = await asyncio.start_server(serve_connection, host, port)
+    port = server.sockets[0].getsockname()[1]
+    if port_file:
+        with open(port_file + ".tmp", "w") as f:
+            f.write(str(port))
+        os.rename(port_file + ".tmp", port_file)
+    print(f"Freebox factice sur http://{host}:{port}{API_PREFIX}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Freebox OS factice pour tester freeboxvm sans Freebox")
+    parser.add_argument("--listen", "-l", metavar="ADDR", default="127.0.0.1",
+                        help="Adresse d'écoute (défaut: %(default)s)")
+    parser.add_argument("--port", "-p", metavar="N", type=int, default=0,
+                        help="Port TCP (défaut: un port libre)")
+    parser.add_argument("--latency", metavar="MS", type=float, default=0,
+                        help="Délai ajouté à chaque réponse, en ms (défaut: %(default)s)")
+    parser.add_argument("--task-delay", metavar="SECONDES", type=float, default=0.2,
+                        help="Durée des changements d'état et des tâches (défaut: %(default)s)")
+    parser.add_argument("--vms", metavar="N", type=int, default=2,
+                        help="Nombre de VM initiales, les paires démarrées (défaut: %(default)s)")
+    parser.add_argument("--port-file", metavar="FICHIER",
+                        help="Écrire le port d'écoute dans ce fichier une fois prêt")
+    args = parser.parse_args()
+
+    _mock.update(latency=args.latency / 1000, task_delay=args.task_delay, vms=args.vms)
+    try:
+        asyncio.run(serve(args.listen, args.port, args.port_file))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,7 @@ BuildRequires:  python3-devel
 BuildRequires:  pyproject-rpm-macros
 
 Requires:       python3dist(requests)
-Requires:       python3dist(websockets) >= 12
+Requires:       python3dist(websockets) >= 14
 Requires:       python3dist(tqdm)
 Requires:       python3dist(humanize)
 
@@ -1,30 +1,215 @@
 #!/usr/bin/env python3
 import os, sys
-import requests, json, argparse
+import json, argparse
 import hashlib, hmac
 import time
 import platform
-from contextlib import contextmanager
-import asyncio
-from websockets.asyncio.client import connect
-import ssl
+from contextlib import contextmanager, asynccontextmanager, nullcontext, suppress
+import importlib.util
 from urllib.parse import urljoin, urlparse
 import re
-import base64
-from tqdm import tqdm
+import base64, binascii
 import signal
-from websockets.exceptions import ConnectionClosed
-import humanize
 from freeboxvm_version import __version__
 
+def lazy_import(name):
+    """Return module `name`, actually imported on first attribute access.
+
+    Commands only pay for the modules they use: requests, the websocket
+    stack, tqdm or humanize are imported where they are needed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+asyncio = lazy_import("asyncio")
+requests = lazy_import("requests")
+
 APP_ID		= "freeboxvm"
 APP_NAME	= "Freebox VM manager"
 DEVICE_NAME	= platform.node()
 
 API_URL		= "http://mafreebox.freebox.fr/api/v8"
+WS_URL		= "wss://mafreebox.freebox.fr/api/v8"
+
+# Environment variable overriding API_URL, like --api-url
+API_URL_ENV	= "FREEBOXVM_API_URL"
 
 DEFAULT_TOKEN_FILE = os.path.join("~", ".config", "freeboxvm", "freeboxvm_token.json")
 
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join("~", ".cache")),
+                                 "freeboxvm")
+
+# Set by --no-cache to ignore cached data
+_cache = { "disabled": False }
+
+# Idle time after which a cached session token is not reused, and minimum
+# delay between two refreshes of its expiry
+SESSION_TTL	= 30 * 60
+SESSION_TOUCH_INTERVAL	= 60
+
+# Process-wide session state: token file used to log in again, session
+# tokens replaced after a 403 (stale -> current), and last refresh of the
+# cached token expiry
+_session = { "token_file": None, "renewed": { }, "touched": None }
+
+# Size of the keep-alive connection pool used for API calls
+HTTP_POOL_SIZE	= 4
+
+# API call timeouts in seconds, the longest matching endpoint prefix wins
+API_TIMEOUTS	= {
+    "": 5,
+    "/downloads/add": 15,
+    "/fs/": 15,
+    "/vm/disk/": 15,
+}
+
+# Retry policy of the API calls after a transient error: new attempts, and
+# first and longest delay between them in seconds (exponential backoff)
+API_RETRIES	= 3
+API_BACKOFF	= 0.5
+API_BACKOFF_MAX	= 8
+API_IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Client-side rate limit of the API calls, in requests per second (0 for
+# none), and number of calls allowed in a burst
+API_RATE_LIMIT	= 0
+API_RATE_BURST	= 10
+
+# Circuit breaker: consecutive transient errors after which the API calls
+# fail immediately (0 for never), and for how long in seconds
+API_BREAKER_FAILURES	= 5
+API_BREAKER_COOLDOWN	= 30
+
+# Number of directory levels listed when looking for the VMs folder
+VMS_SEARCH_DEPTH = 4
+
+# Bumped when the layout of the osinfo catalog cache changes
+OSINFO_CACHE_VERSION = 2
+
+# Number of concurrent URL probes of os-list --check
+URL_CHECK_JOBS	= 8
+
+# Time during which a URL check result is reused
+URL_CHECK_TTL	= 24 * 3600
+
+# URL check results {url: (valid, time)} and probe latencies {host: [seconds]}
+_url_checks = { "results": None, "latency": { }, "jobs": URL_CHECK_JOBS }
+
+# osinfo catalog loaded by this process, see osinfo_catalog()
+_osinfo = { "catalog": None }
+
+# Bounds of the download polling delay when the event websocket is not
+# available, and progress refresh period when it is (seconds)
+DOWNLOAD_POLL_MIN = 0.1
+DOWNLOAD_POLL_MAX = 2.0
+DOWNLOAD_PROGRESS_INTERVAL = 1.0
+
+# States of a download task still running, and time during which the tasks
+# keep being polled while the API does not answer (seconds)
+DOWNLOAD_ACTIVE = ('queued', 'starting', 'downloading', 'checking')
+DOWNLOAD_LOST_TIMEOUT = 60
+
+# Default time to wait for a VM state change, and bounds of the VM polling
+# delay when the event websocket is not available (seconds)
+VM_WAIT_TIMEOUT = 120
+VM_POLL_MIN	= 0.2
+VM_POLL_MAX	= 2.0
+
+# Time during which the VM list is reused
+VM_LIST_TTL	= 10
+
+# API calls changing the VM list or the state of a VM
+VM_MUTATION	= re.compile(r"^/vm/(\d+(/[a-z]+)?/?)?$")
+
+# VM list of this process, with its fetch time, the modification time of
+# the 'vm_list' cache it matches and its index by id and name
+_vm_cache = { "list": None, "time": 0, "mtime": None, "index": None }
+
+# Delay before the agent reopens the event stream (seconds)
+AGENT_RECONNECT_DELAY = 5
+
+# Agent socket used for API calls (None: direct mode), and the connection
+# of each thread to it
+_agent = { "path": None, "local": None }
+
+# Period of the VM list refresh of the multi-VM VNC proxy (seconds)
+VNC_MAP_REFRESH	= 30
+
+# VNC proxy: client write buffer watermarks (bytes)
+VNC_WRITE_HIGH = 1024 * 1024
+VNC_WRITE_LOW = 256 * 1024
+# VNC proxy: default size of reads from the client (bytes)
+VNC_READ_SIZE = 256 * 1024
+
+# Console: maximum size of one read from stdin (bytes)
+CONSOLE_READ_SIZE = 64 * 1024
+# Console: output received within this delay is written at once (seconds),
+# unless it reaches CONSOLE_WRITE_BATCH bytes; rx waits for the terminal
+# when more than CONSOLE_WRITE_HIGH bytes are not written yet
+CONSOLE_FLUSH_DELAY = 0.005
+CONSOLE_WRITE_BATCH = 64 * 1024
+CONSOLE_WRITE_HIGH = 256 * 1024
+# Console server: output replayed to new clients, output a client may lag
+# behind before being dropped (bytes), delay before reopening the console
+# websocket (seconds)
+CONSOLE_SCROLLBACK = 64 * 1024
+CONSOLE_CLIENT_BACKLOG = 1024 * 1024
+CONSOLE_RECONNECT_DELAY = 2
+# Console server: notice sent to the client taking over the console
+CONSOLE_TAKEOVER = "\r\n[freeboxvm] Vous avez la main sur la console.\r\n".encode()
+
+# Maximum age of an unused pre-warmed VNC websocket (seconds)
+VNC_POOL_MAX_IDLE = 60
+
+# VNC websocket handshakes made, their cumulated duration (seconds) and
+# clients served from a pre-warmed websocket
+_vnc_stats = { "handshakes": 0, "handshake_time": 0.0, "pooled": 0 }
+
+# Size of reads from VNC clients, set by --read-size
+_vnc_transport = { "read_size": VNC_READ_SIZE }
+
+# Number of VMs handled concurrently by batch commands
+BATCH_JOBS	= 4
+
+# Process-wide HTTP client state, see http_session()
+_http = { "session": None, "probe": None, "executor": None, "lock": None,
+          "pool_size": HTTP_POOL_SIZE, "timeouts": dict(API_TIMEOUTS), "requests": 0 }
+
+# Retry policy, rate limiter and circuit breaker of the API calls, see
+# api_policy_configure()
+_api_policy = { "retries": API_RETRIES, "rate": API_RATE_LIMIT, "burst": API_RATE_BURST,
+                "tokens": API_RATE_BURST, "refill": 0.0, "lock": None,
+                "threshold": API_BREAKER_FAILURES, "cooldown": API_BREAKER_COOLDOWN,
+                "failures": 0, "open_until": 0.0 }
+
+# Trace of the API calls and websockets, see trace_open()
+TRACE_FORMATS	= ("jsonl", "chrome")
+_trace = { "file": None, "format": "jsonl", "path": None, "start": 0.0, "lock": None,
+           "events": 0, "summary": { } }
+
+# Metrics of the long-running proxies and console servers, see metrics_serve()
+METRICS = {
+    "freeboxvm_clients": ("gauge", "Clients connectés"),
+    "freeboxvm_ws_bytes_total": ("counter", "Octets échangés sur les websockets des sessions"),
+    "freeboxvm_ws_frames_total": ("counter", "Trames échangées sur les websockets des sessions"),
+    "freeboxvm_drain_seconds_total": ("counter", "Temps passé à attendre un destinataire saturé"),
+    "freeboxvm_ws_handshake_seconds": ("histogram", "Durée d'ouverture des websockets"),
+    "freeboxvm_ws_connect_errors_total": ("counter", "Échecs d'ouverture des websockets"),
+    "freeboxvm_ws_reconnects_total": ("counter", "Réouvertures de la websocket d'un serveur de console"),
+    "freeboxvm_tunnel_errors_total": ("counter", "Sessions terminées par une erreur"),
+    "freeboxvm_vnc_pooled_total": ("counter", "Clients VNC servis par une connexion pré-établie"),
+    "freeboxvm_console_dropped_clients_total": ("counter", "Clients de console déconnectés car trop en retard"),
+}
+METRICS_BUCKETS	= (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_metrics = { "values": { }, "histograms": { }, "sessions": { } }
+
 def resolve_token_path(token_file):
     """Expand user shorthand for token paths."""
     return os.path.expanduser(token_file)
@@ -61,9 +246,490 @@ def save_app_token(app_token, track_id, token_file):
     with open(token_path, "w") as file:
         json.dump({"app_token": app_token, "track_id": track_id}, file)
 
-def api_request(method, endpoint, session_token=None, **kwargs):
+def cache_path(name, per_box=True):
+    """Path of the cache file `name`.
+
+    Caches describing the Freebox itself are prefixed with the token file
+    name, so that several Freeboxes (see --token-file) do not share them.
+    """
+    if per_box and _session["token_file"]:
+        token_name = os.path.basename(resolve_token_path(_session["token_file"]))
+        name = f"{os.path.splitext(token_name)[0]}_{name}"
+    return os.path.join(os.path.expanduser(DEFAULT_CACHE_DIR), f"{name}.json")
+
+def load_cache(name, ttl=None, per_box=True):
+    """Load the cache file `name`.
+
+    Returns
+    -------
+    Any | None
+        The cached data, or None if missing, unreadable, older than `ttl`
+        seconds, or if caches are disabled (--no-cache).
+    """
+    if _cache["disabled"]:
+        return None
+    path = cache_path(name, per_box)
+    try:
+        if ttl is not None and time.time() - os.stat(path).st_mtime > ttl:
+            return None
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def cache_mtime(name, per_box=True):
+    """Return the modification time of the cache file `name`, or None if it
+    is missing."""
+    try:
+        return os.stat(cache_path(name, per_box)).st_mtime
+    except OSError:
+        return None
+
+def save_cache(name, data, per_box=True):
+    """Atomically write `data` as JSON to the cache file `name`, readable by
+    the owner only."""
+    path = cache_path(name, per_box)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Impossible d'écrire le cache {path}: {e}", file=sys.stderr)
+
+def drop_cache(name, per_box=True):
+    """Remove the cache file `name`."""
+    try:
+        os.unlink(cache_path(name, per_box))
+    except FileNotFoundError:
+        pass
+
+def session_cache_path(token_file):
+    """Path of the session token cache stored next to the app token file."""
+    root, _ = os.path.splitext(resolve_token_path(token_file))
+    return root + "_session.json"
+
+@contextmanager
+def session_lock(token_file):
+    """Serialize session creation between concurrent freeboxvm processes."""
+    import fcntl
+
+    lock_path = session_cache_path(token_file) + ".lock"
+    lock_dir = os.path.dirname(lock_path)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def load_session_token(token_file):
+    """Load the cached session token if it is still fresh.
+
+    The cache is ignored when it is readable by other users or when it has
+    not been used for SESSION_TTL seconds. Its expiry is only refreshed once
+    the Freebox has accepted the token (see `session_touch`).
+
+    Returns
+    -------
+    str | None
+        The cached session token, or None when a new login is required.
+    """
+    session_path = session_cache_path(token_file)
+    try:
+        st = os.stat(session_path)
+        if st.st_mode & 0o077 or time.time() - st.st_mtime > SESSION_TTL:
+            return None
+        with open(session_path, "r") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return data.get("session_token")
+
+def session_touch():
+    """Refresh the expiry of the cached session token after the Freebox
+    accepted it, at most every SESSION_TOUCH_INTERVAL seconds."""
+    token_file = _session["token_file"]
+    now = time.monotonic()
+    if not token_file or (_session["touched"] is not None and
+                          now - _session["touched"] < SESSION_TOUCH_INTERVAL):
+        return
+    _session["touched"] = now
+    try:
+        os.utime(session_cache_path(token_file))
+    except OSError:
+        pass
+
+def save_session_token(session_token, token_file):
+    """Atomically persist the session token, readable by the owner only."""
+    session_path = session_cache_path(token_file)
+    tmp_path = f"{session_path}.{os.getpid()}"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as file:
+        json.dump({"session_token": session_token, "created": time.time()}, file)
+    os.replace(tmp_path, session_path)
+
+def drop_session_token(token_file):
+    """Forget the cached session token."""
+    try:
+        os.unlink(session_cache_path(token_file))
+    except FileNotFoundError:
+        pass
+
+def current_session_token(session_token):
+    """Return the session token that replaced `session_token`, if any."""
+    return _session["renewed"].get(session_token, session_token)
+
+def session_refresh(stale_token):
+    """Replace a session token rejected by the Freebox.
+
+    Another process may already have logged in again: the shared cache is
+    checked under the lock before starting a new handshake.
+
+    Returns
+    -------
+    str | None
+        The new session token, or None if the login failed.
+    """
+    token_file = _session["token_file"]
+    if not token_file:
+        return None
+    with session_lock(token_file):
+        session_token = load_session_token(token_file)
+        if not session_token or session_token == stale_token:
+            session_token = freebox_login(token_file)
+            if session_token:
+                save_session_token(session_token, token_file)
+            else:
+                drop_session_token(token_file)
+    if session_token:
+        for old, new in _session["renewed"].items():
+            if new == stale_token:
+                _session["renewed"][old] = session_token
+        _session["renewed"][stale_token] = session_token
+    return session_token
+
+def http_configure(pool_size=None, timeouts=None):
+    """Set the connection pool size and per-endpoint timeouts.
+
+    Must be called before the first API call to change the pool size.
+
+    Parameters
+    ----------
+    pool_size : int | None
+        Maximum number of keep-alive connections kept open per host.
+    timeouts : dict[str, float] | None
+        Timeouts in seconds indexed by endpoint prefix ('' is the default).
+    """
+    if pool_size:
+        _http["pool_size"] = pool_size
+    if timeouts:
+        _http["timeouts"].update(timeouts)
+
+def api_policy_configure(retries=None, rate_limit=None, breaker=None):
+    """Set the retry policy, rate limit and circuit breaker of the API calls.
+
+    Parameters
+    ----------
+    retries : int | None
+        New attempts after a transient error, 0 to disable retries.
+    rate_limit : tuple[float, int] | None
+        (requests per second, burst size), 0 requests per second to remove
+        the limit. The limit is shared by all the threads of the process.
+    breaker : tuple[int, float] | None
+        (consecutive transient errors, seconds during which the calls fail
+        immediately), 0 errors to disable the circuit breaker.
+    """
+    if retries is not None:
+        _api_policy["retries"] = retries
+    if rate_limit:
+        rate, burst = rate_limit
+        _api_policy.update(rate=rate, burst=burst, tokens=burst)
+        if rate and _api_policy["lock"] is None:
+            import threading
+
+            _api_policy["lock"] = threading.Lock()
+    if breaker:
+        _api_policy["threshold"], _api_policy["cooldown"] = breaker
+
+def api_configure(url):
+    """Send the API calls to `url` instead of API_URL, e.g. a test server.
+
+    The websockets follow on the same host, with wss:// for an https://
+    URL and ws:// otherwise.
+    """
+    global API_URL, WS_URL
+    scheme, sep, rest = url.rstrip("/").partition("://")
+    if not sep or scheme not in ("http", "https"):
+        raise ValueError(f"URL d'API invalide : {url}")
+    API_URL = f"{scheme}://{rest}"
+    WS_URL = f"{'wss' if scheme == 'https' else 'ws'}://{rest}"
+
+def http_session():
+    """Return the process-wide `requests.Session` with its connection pool.
+
+    Once worker threads exist (see `api_executor`), the first call, which
+    also imports requests, is made under a lock: neither the lazy import
+    nor the creation of the session are thread-safe.
+    """
+    if _http["session"] is None:
+        with _http["lock"] or nullcontext():
+            if _http["session"] is None:
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=_http["pool_size"])
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http["session"] = session
+    return _http["session"]
+
+def api_executor():
+    """Return the worker threads running `api_request_async` calls.
+
+    There is one worker per pooled connection, so concurrent calls never
+    wait for a connection.
+    """
+    if _http["executor"] is None:
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        _http["lock"] = threading.Lock()
+        if _api_policy["lock"] is None:
+            _api_policy["lock"] = threading.Lock()
+        _http["executor"] = ThreadPoolExecutor(max_workers=_http["pool_size"],
+                                               thread_name_prefix="freeboxvm-api")
+    return _http["executor"]
+
+def api_timeout(endpoint):
+    """Timeout of an API call, from the longest matching prefix in API_TIMEOUTS."""
+    prefix = max((p for p in _http["timeouts"] if endpoint.startswith(p)), key=len)
+    return _http["timeouts"][prefix]
+
+def http_stats():
+    """Return (connections opened, requests made) by the API client."""
+    connections = 0
+    session = _http["session"]
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+    return connections, _http["requests"]
+
+def trace_open(path, trace_format="jsonl"):
+    """Record the API calls, websockets and slow steps of this run in `path`.
+
+    Events are written as they end, one JSON object per line, or in the
+    Chrome trace event format (chrome://tracing, Perfetto) with 'chrome'.
+    """
+    import threading
+
+    _trace.update(file=open(path, "w", buffering=1), format=trace_format, path=path,
+                  start=time.perf_counter(), lock=threading.Lock())
+    if trace_format == "chrome":
+        _trace["file"].write("[\n")
+
+def trace_name(endpoint):
+    """`endpoint` without its ids and paths, to group the calls."""
+    endpoint = re.sub(r"/fs/ls/[^/?]*", "/fs/ls/{path}", endpoint)
+    return re.sub(r"/\d+", "/{id}", endpoint)
+
+def trace_record(cat, name, start, group=None, error=False, **fields):
+    """Record an event of category `cat` begun at perf_counter() `start` and
+    ending now. It is summed up under `group` (default `name`)."""
+    if not _trace["file"]:
+        return
+    import threading
+
+    duration = time.perf_counter() - start
+    with _trace["lock"]:
+        stats = _trace["summary"].setdefault((cat, group or name), {
+            "count": 0, "time": 0.0, "max": 0.0, "bytes": 0, "errors": 0 })
+        stats["count"] += 1
+        stats["time"] += duration
+        stats["max"] = max(stats["max"], duration)
+        stats["bytes"] += fields.get("bytes") or 0
+        stats["errors"] += bool(error)
+
+        if _trace["format"] == "chrome":
+            event = { "name": name, "cat": cat, "ph": "X",
+                      "ts": round((start - _trace["start"]) * 1e6),
+                      "dur": round(duration * 1e6), "pid": os.getpid(),
+                      "tid": threading.get_ident(), "args": dict(fields, error=error) }
+            separator = ",\n" if _trace["events"] else ""
+        else:
+            event = { "ts": round(start - _trace["start"], 6), "cat": cat, "name": name,
+                      "duration": round(duration, 6), "error": error, **fields }
+            separator = ""
+        _trace["file"].write(separator + json.dumps(event, default=str)
+                             + ("\n" if _trace["format"] == "jsonl" else ""))
+        _trace["events"] += 1
+
+@contextmanager
+def traced(name, **fields):
+    """Record the enclosed block, or the decorated function, as a step of
+    the trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace_record("step", name, start, **fields)
+
+def ws_counters():
+    """Counters of a websocket session: frames and bytes received from the
+    VM (in) and sent to it (out), and seconds spent waiting for the client
+    (drain_in) or the websocket (drain_out). See `trace_ws` and
+    `metrics_session`."""
+    return { "frames_in": 0, "bytes_in": 0, "frames_out": 0, "bytes_out": 0,
+             "drain_in": 0.0, "drain_out": 0.0 }
+
+def trace_ws(path, start, counters, ws):
+    """Record a websocket session on `path` opened at perf_counter() `start`."""
+    trace_record("ws", f"session {path}", start, group=f"session {trace_name(path)}",
+                 bytes=counters["bytes_in"] + counters["bytes_out"],
+                 close_code=ws.close_code, **counters)
+
+def trace_close():
+    """End the trace file and print its summary, by cumulative time."""
+    if not _trace["file"]:
+        return
+    if _trace["format"] == "chrome":
+        _trace["file"].write("\n]\n")
+    _trace["file"].close()
+    _trace["file"] = None
+
+    print(f"Trace : {_trace['events']} événements dans {_trace['path']}", file=sys.stderr)
+    print(f"{'TYPE':<5} {'APPEL':<40} {'NOMBRE':>6} {'TOTAL ms':>9} {'MOYEN ms':>9} "
+          f"{'MAX ms':>8} {'OCTETS':>10} {'ERREURS':>7}", file=sys.stderr)
+    for (cat, name), stats in sorted(_trace["summary"].items(), key=lambda item: -item[1]["time"]):
+        print(f"{cat:<5} {name:<40} {stats['count']:>6} {stats['time'] * 1000:>9.1f} "
+              f"{stats['time'] * 1000 / stats['count']:>9.1f} {stats['max'] * 1000:>8.1f} "
+              f"{stats['bytes']:>10} {stats['errors']:>7}", file=sys.stderr)
+
+def metric_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def metric_add(name, value=1, **labels):
+    """Add `value` to the counter or gauge `name` with `labels`."""
+    key = metric_key(name, labels)
+    _metrics["values"][key] = _metrics["values"].get(key, 0) + value
+
+def metric_observe(name, value, **labels):
+    """Count `value` in the histogram `name` with `labels`."""
+    import bisect
+
+    key = metric_key(name, labels)
+    histogram = _metrics["histograms"].get(key)
+    if histogram is None:
+        histogram = _metrics["histograms"][key] = {
+            "buckets": [ 0 ] * (len(METRICS_BUCKETS) + 1), "sum": 0.0 }
+    histogram["buckets"][bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+    histogram["sum"] += value
+
+# ws_counters() fields, by metric and direction
+SESSION_METRICS = {
+    "frames_in": ("freeboxvm_ws_frames_total", "from_vm"),
+    "frames_out": ("freeboxvm_ws_frames_total", "to_vm"),
+    "bytes_in": ("freeboxvm_ws_bytes_total", "from_vm"),
+    "bytes_out": ("freeboxvm_ws_bytes_total", "to_vm"),
+    "drain_in": ("freeboxvm_drain_seconds_total", "to_client"),
+    "drain_out": ("freeboxvm_drain_seconds_total", "to_vm"),
+}
+
+@contextmanager
+def metrics_session(service, vm_id, counters):
+    """Publish the `ws_counters` of a session of `service` ('vnc' or
+    'console') in the metrics while the block runs.
+
+    The copy loops only update their own counters; live sessions are
+    summed up when the metrics are read, and added to the totals on exit.
+    """
+    key = id(counters)
+    _metrics["sessions"][key] = (service, vm_id, counters)
+    try:
+        yield
+    finally:
+        del _metrics["sessions"][key]
+        for field, (name, direction) in SESSION_METRICS.items():
+            metric_add(name, counters[field], service=service, vm=vm_id, direction=direction)
+
+def metrics_text():
+    """Return the metrics in the Prometheus text exposition format."""
+    def escape(value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def labels_text(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+    values = dict(_metrics["values"])
+    for service, vm_id, counters in _metrics["sessions"].values():
+        for field, (name, direction) in SESSION_METRICS.items():
+            key = metric_key(name, { "service": service, "vm": vm_id, "direction": direction })
+            values[key] = values.get(key, 0) + counters[field]
+
+    lines = [ ]
+    for name, (kind, description) in METRICS.items():
+        lines += [ f"# HELP {name} {description}", f"# TYPE {name} {kind}" ]
+        if kind != "histogram":
+            lines += [ f"{name}{labels_text(labels)} {value}"
+                       for (metric, labels), value in sorted(values.items()) if metric == name ]
+            continue
+        for (metric, labels), histogram in sorted(_metrics["histograms"].items()):
+            if metric != name:
+                continue
+            count = 0
+            for bound, n in zip((*METRICS_BUCKETS, "+Inf"), histogram["buckets"]):
+                count += n
+                lines.append(f"{name}_bucket{labels_text(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_sum{labels_text(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{labels_text(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+async def metrics_serve(address):
+    """Serve `metrics_text` on GET /metrics at `address`, a (host, port)
+    tuple. Returns the asyncio server."""
+    async def handler(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            target = request.split(b" ", 2)[1]
+            if target.split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", metrics_text().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(f"HTTP/1.1 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                         + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                IndexError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    host, port = address
+    server = await asyncio.start_server(handler, host, port)
+    print(f"Métriques sur http://{host}:{port}/metrics")
+    return server
+
+def api_request(method, endpoint, session_token=None, empty=None, **kwargs):
     """Call a Freebox OS API endpoint and return its `result` payload.
 
+    Transient errors are retried and the calls are rate limited, see
+    `api_attempts`. When a session token is rejected with HTTP 403, a new
+    session is opened (see `session_refresh`) and the call is retried once.
+    Calls changing a VM drop the cached VM list.
+
     Parameters
     ----------
     method : str
@@ -72,45 +738,373 @@ def api_request(method, endpoint, session_token=None, **kwargs):
         API path beginning with '/'.
     session_token : str | None
         Optional session token to send as 'X-Fbx-App-Auth'.
+    empty : Any
+        Value returned for a successful GET without result, e.g. [] for a
+        listing, to tell it apart from a failed call.
     **kwargs : dict
-        Extra arguments forwarded to `requests.request` (json=data, params, etc.).
+        Extra arguments forwarded to `requests.Session.request` (json=data,
+        params, etc.).
 
     Returns
     -------
     Any | str | None
-        The `result` field on success; the string 'forbidden' on HTTP 403;
-        or None on network/JSON errors.
+        The `result` field on success (True for an action without result,
+        `empty` for a GET without result); the string 'forbidden' on HTTP 403;
+        or None on API/network/JSON errors, once the retries are exhausted,
+        and while the circuit breaker is open.
 
     Side Effects
     ------------
-    Logs API/network/JSON errors to journald.
+    Logs API/network/JSON errors to journald. With --trace, records the
+    call (see `trace_record`).
+    """
+    start = time.perf_counter()
+    call = { "retries": 0 }
+    mutation = method.lower() != "get" and VM_MUTATION.match(endpoint)
+    if _agent["path"]:
+        reply = agent_request({ "op": "api", "method": method, "endpoint": endpoint,
+                                "kwargs": kwargs, "empty": empty, "no_cache": _cache["disabled"] })
+        if reply is not None:
+            call["via"] = "agent"
+            result = reply.get("result")
+            # the agent drops its own copy, the cache of this process may differ
+            if mutation:
+                invalidate_vm_list()
+            trace_api(method, endpoint, start, call, result)
+            return result
+    if session_token:
+        session_token = current_session_token(session_token)
+    result = api_attempts(method, endpoint, session_token, call, **kwargs)
+    if result == "forbidden" and session_token:
+        session_token = session_refresh(session_token)
+        if session_token:
+            call["retries"] += 1
+            result = api_attempts(method, endpoint, session_token, call, **kwargs)
+    if result is None and "status" in call and "error" not in call:
+        result = empty
+    if session_token and result != "forbidden" and "status" in call and call["status"] < 400:
+        session_touch()
+    if mutation:
+        invalidate_vm_list()
+    trace_api(method, endpoint, start, call, result)
+    return result
+
+def trace_api(method, endpoint, start, call, result):
+    """Record an `api_request` call, with the `call` details filled by `api_call`."""
+    if _trace["file"]:
+        method = method.upper()
+        fields = dict(call)
+        error = fields.pop("error", None) or result == "forbidden"
+        trace_record("api", f"{method} {endpoint}", start, group=f"{method} {trace_name(endpoint)}",
+                     error=error, **fields)
+
+def agent_request(message):
+    """Send `message` to the agent and return its reply.
+
+    Each thread keeps its own connection to the agent. Returns None, and
+    leaves agent mode, if the agent cannot be reached.
+    """
+    import socket
+
+    local = _agent["local"]
+    for attempt in range(2):
+        try:
+            if getattr(local, "conn", None) is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(_agent["path"])
+                local.conn = sock.makefile("rwb")
+                sock.close()
+            local.conn.write(json.dumps(message).encode("utf-8") + b"\n")
+            local.conn.flush()
+            line = local.conn.readline()
+            if line:
+                return json.loads(line)
+        except (OSError, ValueError):
+            pass
+        except TypeError:
+            return None  # not serializable: call the API directly
+        if getattr(local, "conn", None) is not None:
+            try:
+                local.conn.close()
+            except OSError:
+                pass
+            local.conn = None
+    _agent["path"] = None
+    return None
+
+def agent_connect():
+    """Switch to agent mode if an agent is running for this Freebox.
+
+    Returns
+    -------
+    str | None
+        The agent's session token, or None (direct mode).
+    """
+    import threading
+
+    path = runtime_socket_path("agent")
+    if not os.path.exists(path):
+        return None
+    _agent.update(path=path, local=threading.local())
+    reply = agent_request({ "op": "token" })
+    return reply.get("token") if reply else None
+
+async def run_agent(session_token, path):
+    """Serve the API calls of other freeboxvm processes on the Unix socket
+    `path`, until SIGINT or SIGTERM.
+
+    Requests and replies are JSON lines: {"op": "token"} returns the
+    session token, {"op": "api", "method", "endpoint", "kwargs"} the result
+    of `api_request`. The agent keeps its HTTP connection pool open, and
+    its VM list (see `get_vm_list`), also dropped on each vm_state_changed
+    event.
+    """
+    from websockets.exceptions import ConnectionClosed
+
+    stop = stop_on_signals()
+    clients = set()
+
+    async def client(reader, writer):
+        clients.add(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    break
+                if request.get("op") == "token":
+                    reply = { "token": current_session_token(session_token) }
+                elif request.get("op") == "api":
+                    method, endpoint = request["method"], request["endpoint"]
+                    if method.lower() == "get" and endpoint == "/vm/" and not request["kwargs"] \
+                       and not request.get("no_cache"):
+                        loop = asyncio.get_running_loop()
+                        result = await loop.run_in_executor(api_executor(), get_vm_list, session_token)
+                    else:
+                        result = await api_request_async(method, endpoint, session_token,
+                                                         empty=request.get("empty"),
+                                                         **request["kwargs"])
+                    reply = { "result": result }
+                else:
+                    reply = { }
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    async def events():
+        while True:
+            async with subscribe_events(session_token, [ "vm_state_changed" ]) as ws:
+                if ws is not None:
+                    invalidate_vm_list()
+                    try:
+                        async for msg in ws:
+                            invalidate_vm_list()
+                    except ConnectionClosed:
+                        pass
+            await asyncio.sleep(AGENT_RECONNECT_DELAY)
+
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            writer.close()
+            print(f"Un agent écoute déjà sur {path}", file=sys.stderr)
+            sys.exit(1)
+    umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(client, path)
+    finally:
+        os.umask(umask)
+    print(f"Agent freeboxvm à l'écoute sur {path}")
+
+    watcher = asyncio.create_task(events())
+    try:
+        await stop
+    finally:
+        server.close()
+        for writer in clients:
+            writer.close()
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
+        if os.path.exists(path):
+            os.unlink(path)
+    print("Arrêt de l'agent...")
+
+async def api_request_async(method, endpoint, session_token=None, **kwargs):
+    """Asynchronous variant of `api_request`, with the same arguments and
+    return values.
+
+    The call runs on `api_executor()` and shares the HTTP connection pool, so
+    the event loop keeps serving the console and VNC websockets meanwhile.
+    """
+    import functools
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(api_executor(), functools.partial(
+        api_request, method, endpoint, session_token, **kwargs))
+
+def api_attempts(method, endpoint, session_token, call, **kwargs):
+    """Call `api_call` until it succeeds or fails for good.
+
+    Each attempt waits for the rate limiter (see `rate_limit_wait`). After
+    a transient error (see `api_call`) the call is attempted again, up to
+    the configured number of retries and after an exponential backoff with
+    full jitter, if its method is idempotent or the connection could not
+    be opened. No call is made while the circuit breaker is open.
+    """
+    attempt = 0
+    while True:
+        if breaker_remaining():
+            call["error"] = "circuit ouvert"
+            return None
+        waited = rate_limit_wait()
+        if waited:
+            call["throttled"] = round(call.get("throttled", 0) + waited, 6)
+        result = api_call(method, endpoint, session_token, call=call, **kwargs)
+        transient = call.get("transient")
+        breaker_record(transient is not None)
+        if not transient or attempt >= _api_policy["retries"] or \
+           not (transient == "connect" or method.upper() in API_IDEMPOTENT_METHODS):
+            return result
+        import random
+
+        delay = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF * 2 ** attempt))
+        # the server may ask for more, but never for longer than a backoff
+        time.sleep(max(delay, min(call.pop("retry_after", 0), API_BACKOFF_MAX)))
+        attempt += 1
+        call["retries"] += 1
+
+def rate_limit_wait():
+    """Take a token from the API rate limiter (token bucket), sleeping until
+    one is available. Returns the time waited in seconds."""
+    rate = _api_policy["rate"]
+    if not rate:
+        return 0.0
+    with _api_policy["lock"]:
+        now = time.monotonic()
+        tokens = min(_api_policy["burst"], _api_policy["tokens"] + (now - _api_policy["refill"]) * rate)
+        # a negative balance reserves the next tokens for the waiting threads
+        _api_policy.update(tokens=tokens - 1, refill=now)
+    wait = max(0.0, (1 - tokens) / rate)
+    if wait:
+        time.sleep(wait)
+    return wait
+
+def breaker_remaining():
+    """Return the seconds during which the circuit breaker still makes the
+    API calls fail immediately, 0 when it lets them through."""
+    return max(0.0, _api_policy["open_until"] - time.monotonic())
+
+def breaker_record(failed):
+    """Count a transient API error, or reset the count after any answer.
+
+    The circuit breaker opens after `threshold` consecutive errors. Once
+    its cooldown is over a single new error opens it again. The count is
+    shared by the worker threads (see `api_executor`), hence the lock.
+    """
+    with _api_policy["lock"] or nullcontext():
+        if not failed:
+            _api_policy["failures"] = 0
+            return
+        _api_policy["failures"] += 1
+        threshold = _api_policy["threshold"]
+        opened = threshold and _api_policy["failures"] >= threshold and not breaker_remaining()
+        if opened:
+            _api_policy["open_until"] = time.monotonic() + _api_policy["cooldown"]
+    if opened:
+        print(f"Freebox injoignable : appels API suspendus pendant {_api_policy['cooldown']:g} s")
+
+def api_call(method, endpoint, session_token=None, call=None, **kwargs):
+    """Perform a single Freebox OS API call (see `api_request`).
+
+    The HTTP status and response size are stored in the `call` dict, if any,
+    and for a transient error its 'transient' key is set to 'connect' when
+    the connection could not be opened, 'network' for a later network error
+    or timeout, and 'server' for an HTTP 429 or 5xx status (with the
+    Retry-After delay, if any, in 'retry_after').
     """
     headers = {}
     if session_token:
         headers["X-Fbx-App-Auth"] = session_token
+    if call is None:
+        call = { }
+    for key in ("error", "transient", "retry_after"):
+        call.pop(key, None)
 
+    kwargs.setdefault("timeout", api_timeout(endpoint))
+    _http["requests"] += 1
     try:
-        response = requests.request(method, f"{API_URL}{endpoint}", headers=headers,
-                                    timeout=5, **kwargs)
+        response = http_session().request(method, f"{API_URL}{endpoint}",
+                                          headers=headers, **kwargs)
+        call.update(status=response.status_code, bytes=len(response.content))
         response.raise_for_status()
         data = response.json()
         if data.get('success'):
+            if method.lower() != "get":
+                return data.get('result', True)
             return data.get('result')
         else:
+            call["error"] = data.get('error_code') or data.get('msg')
             print(f"{endpoint}: {data.get('msg')}")
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 403:
             return "forbidden" # Return a special string for 403 errors
         else:
+            call["error"] = str(e)
+            if e.response.status_code == 429 or e.response.status_code >= 500:
+                call["transient"] = "server"
+                retry_after = e.response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    call["retry_after"] = int(retry_after)
             print(f"Erreur HTTP sur {endpoint}: {e}")
     except requests.exceptions.RequestException as e:
+        call["error"] = str(e)
+        if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            from urllib3.exceptions import ConnectTimeoutError
+
+            reason = getattr(e.args[0], "reason", None) if e.args else None
+            connect = isinstance(e, requests.exceptions.ConnectTimeout) or \
+                      isinstance(reason, ConnectTimeoutError)
+            call["transient"] = "connect" if connect else "network"
         print(f"Erreur de réseau sur {endpoint}: {e}")
     except json.JSONDecodeError:
+        call["error"] = "json"
         print(f"Erreur de décodage JSON sur {endpoint}")
     return None
 
 def freebox_connect(token_file):
-    """Establish a Freebox OS API session token.
+    """Return a Freebox OS API session token, reusing the cached one.
+
+    The session token is shared by all freeboxvm processes through
+    `session_cache_path(token_file)`; a new login (see `freebox_login`) is
+    only performed when there is no fresh cached token. A token that has
+    expired on the Freebox side is replaced by `api_request` on HTTP 403.
+
+    Returns
+    -------
+    str | None
+        A session token, or None if the login fails.
+    """
+    _session["token_file"] = token_file
+    with session_lock(token_file):
+        session_token = load_session_token(token_file)
+        if session_token:
+            return session_token
+        session_token = freebox_login(token_file)
+        if session_token:
+            save_session_token(session_token, token_file)
+    return session_token
+
+@traced("freebox_login")
+def freebox_login(token_file):
+    """Open a new Freebox OS API session.
 
     1) Load stored app token/track_id; otherwise request authorization and poll
        until the user approves the app on the Freebox.
@@ -155,7 +1149,7 @@ def freebox_connect(token_file):
             return None
 
     challenge_data = api_request("get", f"/login/authorize/{track_id}")
-    if not challenge_data or not isinstance(challenge_data, dict):
+    if not isinstance(challenge_data, dict) or not challenge_data.get('challenge'):
         print("Échec pour obtenir le challenge, le token doit être invalide.")
         return None
     challenge = challenge_data['challenge']
@@ -167,94 +1161,522 @@ def freebox_connect(token_file):
         return None
     return login_data['session_token'] if login_data else None
 
-def search_VMs(session_token, path):
-    path_b64 = base64.b64encode(path.encode("utf-8")).decode("ascii")
-    res = api_request("get", f"/fs/ls/{path_b64}", session_token, data = { 'onlyFolder': True, 'removeHidden': True })
-    for entry in res:
-        if entry['hidden'] or not entry['mimetype'] == 'inode/directory' or entry['name'] == '.' or entry['name'] == '..':
-            continue
-        path = base64.b64decode(entry['path']).decode('utf-8')
-        if entry['name'] == 'VMs':
-            return path
-        res = search_VMs(session_token, path)
-        if res != None:
-            return res
+@traced("search_VMs")
+def search_VMs(session_token, path, max_depth=VMS_SEARCH_DEPTH):
+    """Return the path of the 'VMs' folder below `path`, or None.
+
+    The last path found is cached and checked with a single `/fs/ls` call;
+    otherwise the storage tree is scanned by `scan_VMs`.
+    """
+    cached = load_cache("vms_dir")
+    if cached and cached.get("root") == path:
+        path_b64 = base64.b64encode(cached["path"].encode("utf-8")).decode("ascii")
+        res = api_request("get", f"/fs/ls/{path_b64}", session_token, empty=[ ],
+                          data = { 'onlyFolder': True, 'removeHidden': True })
+        if res is not None and res != "forbidden":
+            return cached["path"]
+        drop_cache("vms_dir")
+
+    vms_path = asyncio.run(scan_VMs(session_token, path, max_depth))
+    if vms_path:
+        save_cache("vms_dir", { "root": path, "path": vms_path })
+    return vms_path
+
+async def scan_VMs(session_token, path, max_depth):
+    """Breadth-first search of a 'VMs' folder, listing at most `max_depth`
+    levels of directories below `path`. Sibling directories are listed
+    concurrently.
+    """
+    async def ls(path):
+        path_b64 = base64.b64encode(path.encode("utf-8")).decode("ascii")
+        res = await api_request_async("get", f"/fs/ls/{path_b64}", session_token,
+                                      data = { 'onlyFolder': True, 'removeHidden': True })
+        return res if res and res != "forbidden" else []
+
+    level = [ path ]
+    for depth in range(max_depth):
+        subdirs = [ ]
+        for res in await asyncio.gather(*(ls(path) for path in level)):
+            for entry in res:
+                if entry['hidden'] or not entry['mimetype'] == 'inode/directory' or entry['name'] == '.' or entry['name'] == '..':
+                    continue
+                path = base64.b64decode(entry['path']).decode('utf-8')
+                if entry['name'] == 'VMs':
+                    return path
+                subdirs.append(path)
+        if not subdirs:
+            break
+        level = subdirs
     return None
 
-async def console_link(session_token, vm_id):
-    url = f"wss://mafreebox.freebox.fr/api/v8/vm/{vm_id}/console"
-
-    # TLS verification
-    ssl_ctx = ssl.create_default_context()
-    ssl_ctx.check_hostname = False
-    ssl_ctx.verify_mode = ssl.CERT_NONE
-    async with connect(
-        url,
-        additional_headers={"X-Fbx-App-Auth": session_token},
-        subprotocols=['binary'],
-        ssl=ssl_ctx
-    ) as ws:
-        loop = asyncio.get_running_loop()
-
-        CTRL_B = b"\x02"              # Ctrl-B
-        HELP_KEYS = { b"?" } # Ctrl-B ?
-        DETACH_KEYS = { b"d", b"D" } # Ctrl-B D
-        PASSTHRU_KEYS = { b"b", b"B" } # Ctrl-B B
-        HALT_KEYS = { b"h", b"H" } # Ctrl-B H
-        RESET_KEYS = { b"r", b"R" } # Ctrl-B R
-        STOP_KEYS = { b"s", b"S" } # Ctrl-B S
-
-        async def rx():
-            async for msg in ws:
-                if isinstance(msg, str):
-                    sys.stdout.write(msg)
-                else:
-                    sys.stdout.buffer.write(msg)
-                sys.stdout.flush()
+async def read_input(loop, fd, size):
+    """Read up to `size` bytes available on `fd`, b'' at end of file.
 
-        async def tx():
-            waiting_cmd = False
-            while True:
-                data = await loop.run_in_executor(None, sys.stdin.buffer.read, 1)
-                if not data:
-                    break
+    The event loop waits for `fd` to be readable, so no thread is needed;
+    files that cannot be polled are read in the default executor.
+    """
+    ready = loop.create_future()
+    try:
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    except (PermissionError, ValueError):
+        return await loop.run_in_executor(None, os.read, fd, size)
+    try:
+        await ready
+    finally:
+        loop.remove_reader(fd)
+    return os.read(fd, size)
+
+def output_open(loop, fd):
+    """Open a coalescing writer on `fd`.
+
+    Data given to `output_write` is buffered and written at most every
+    CONSOLE_FLUSH_DELAY seconds. Writes run one at a time in the default
+    executor, so the event loop never blocks on the terminal while `fd`
+    stays in blocking mode for the other users of the terminal.
+    """
+    return { "loop": loop, "fd": fd, "pending": bytearray(), "timer": None,
+             "flushed": 0.0, "writing": None, "inflight": 0, "error": None }
+
+def output_write(out, data):
+    """Queue `data` for writing.
+
+    The first write after a quiet period is flushed at the next loop
+    iteration, later ones wait for the end of the CONSOLE_FLUSH_DELAY window.
+    """
+    out["pending"] += data
+    if len(out["pending"]) >= CONSOLE_WRITE_BATCH:
+        output_flush(out)
+    elif out["timer"] is None:
+        delay = max(0.0, out["flushed"] + CONSOLE_FLUSH_DELAY - out["loop"].time())
+        out["timer"] = out["loop"].call_later(delay, output_flush, out)
+
+def output_flush(out):
+    """Start writing the queued data, unless a write is in progress: the
+    data is then written as soon as it ends."""
+    if out["timer"] is not None:
+        out["timer"].cancel()
+        out["timer"] = None
+    out["flushed"] = out["loop"].time()
+    if out["error"] is not None:
+        out["pending"].clear()
+    if out["writing"] is not None or not out["pending"]:
+        return
+    data = bytes(out["pending"])
+    out["pending"].clear()
+    out["inflight"] = len(data)
+    out["writing"] = out["loop"].run_in_executor(None, write_all, out["fd"], data)
+    out["writing"].add_done_callback(lambda future: output_written(out, future))
+
+def output_written(out, future):
+    """Record the end of a write and start the next one."""
+    out["writing"] = None
+    out["inflight"] = 0
+    if future.exception() is not None and out["error"] is None:
+        out["error"] = future.exception()
+    output_flush(out)
+
+def write_all(fd, data):
+    """Write all of `data` to `fd`."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+async def output_drain(out):
+    """Wait while the terminal is more than CONSOLE_WRITE_HIGH bytes behind.
+
+    Raises the error of a failed write.
+    """
+    while out["writing"] is not None and \
+          len(out["pending"]) + out["inflight"] > CONSOLE_WRITE_HIGH:
+        await asyncio.wait([ out["writing"] ])
+    if out["error"] is not None:
+        raise out["error"]
+
+async def output_close(out):
+    """Write what is left."""
+    output_flush(out)
+    while out["writing"] is not None:
+        await asyncio.wait([ out["writing"] ])
+
+async def ws_connect(session_token, path, **kwargs):
+    """Open a websocket on the Freebox API endpoint `path`.
+
+    Keyword arguments are passed to websockets.connect(). The connection
+    is returned open; used with `async with`, it is closed on exit. When
+    the session token is rejected with HTTP 403, a new session is opened
+    (see `session_refresh`) and the handshake is retried once. With
+    --trace, the handshakes are recorded.
+    """
+    import ssl
+    from websockets.asyncio.client import connect
+    from websockets.exceptions import InvalidStatus
+
+    if WS_URL.startswith("wss:"):
+        # TLS verification disabled (Freebox local cert); change if you pinned certs.
+        ssl_ctx = ssl.create_default_context()
+        ssl_ctx.check_hostname = False
+        ssl_ctx.verify_mode = ssl.CERT_NONE
+        kwargs["ssl"] = ssl_ctx
+    for attempt in range(2):
+        session_token = current_session_token(session_token)
+        start = time.perf_counter()
+        try:
+            ws = await connect(WS_URL + path,
+                               additional_headers={"X-Fbx-App-Auth": session_token},
+                               **kwargs)
+            break
+        except Exception as e:
+            metric_add("freeboxvm_ws_connect_errors_total", path=trace_name(path))
+            trace_record("ws", f"connect {path}", start, group=f"connect {trace_name(path)}",
+                         error=True, message=str(e))
+            if attempt or not isinstance(e, InvalidStatus) or e.response.status_code != 403:
+                raise
+            loop = asyncio.get_running_loop()
+            if not await loop.run_in_executor(api_executor(), session_refresh, session_token):
+                raise
+    session_touch()
+    metric_observe("freeboxvm_ws_handshake_seconds", time.perf_counter() - start,
+                   path=trace_name(path))
+    trace_record("ws", f"connect {path}", start, group=f"connect {trace_name(path)}",
+                 subprotocol=ws.subprotocol)
+    return ws
+
+async def console_io(session_token, vm_id, messages, send, close, read_only=False,
+                     is_writer=None):
+    """Link the terminal to a console.
+
+    `messages` is an async iterator over the console output, `send` and
+    `close` are coroutine functions sending input and detaching. Ctrl-B
+    commands are handled here; with `read_only`, other input is dropped.
+    The power commands are refused with `read_only`, and while `is_writer`,
+    if given, returns False: on a shared console, only the client holding
+    it may stop the VM.
+    """
+    loop = asyncio.get_running_loop()
+    stdin_fd = sys.stdin.fileno()
+
+    CTRL_B = b"\x02"              # Ctrl-B
+    HELP_KEYS = { b"?" } # Ctrl-B ?
+    DETACH_KEYS = { b"d", b"D" } # Ctrl-B D
+    PASSTHRU_KEYS = { b"b", b"B" } # Ctrl-B B
+    HALT_KEYS = { b"h", b"H" } # Ctrl-B H
+    RESET_KEYS = { b"r", b"R" } # Ctrl-B R
+    STOP_KEYS = { b"s", b"S" } # Ctrl-B S
+
+    if read_only:
+        async def send(data):
+            pass
+
+    async def rx():
+        # Bursts are coalesced by the output stage; only wait for the
+        # terminal when it is far behind, websocket flow control then
+        # slows the VM console down.
+        async for msg in messages:
+            output_write(output, msg.encode() if isinstance(msg, str) else msg)
+            await output_drain(output)
+
+    def can_power():
+        return not read_only and (is_writer is None or is_writer())
+
+    async def command(key):
+        """Run the Ctrl-B `key` command, return False to detach."""
+        if key in DETACH_KEYS:
+            await close()
+            return False
+        elif key in HELP_KEYS:
+            output_write(output, "\r\n"
+                         "    Ctrl-B ? : Affiche l'aide\r\n"
+                         "    Ctrl-B D : Détache la console\r\n".encode())
+            if can_power():
+                output_write(output,
+                             "    Ctrl-B H : Arrête la VM\r\n"
+                             "    Ctrl-B S : Force l'arrêt de la VM\r\n"
+                             "    Ctrl-B R : Redémarre la VM\r\n"
+                             "    Ctrl-B B : Envoie Ctrl-B a la console\r\n".encode())
+        elif key in HALT_KEYS | STOP_KEYS | RESET_KEYS and not can_power():
+            output_write(output, "\r\n[freeboxvm] Console en lecture seule, commande ignorée.\r\n".encode())
+        elif key in HALT_KEYS:
+            await api_request_async("post", f"/vm/{vm_id}/powerbutton", session_token)
+        elif key in STOP_KEYS:
+            await api_request_async("post", f"/vm/{vm_id}/stop", session_token)
+        elif key in RESET_KEYS:
+            await api_request_async("post", f"/vm/{vm_id}/restart", session_token)
+        elif key in PASSTHRU_KEYS:
+            await send(CTRL_B)
+        else:
+            await send(CTRL_B + key)
+        return True
+
+    async def tx():
+        # Everything available on stdin is read at once and sent in one
+        # frame; the batch is only split around Ctrl-B commands.
+        waiting_cmd = False
+        while True:
+            data = await read_input(loop, stdin_fd, CONSOLE_READ_SIZE)
+            if not data:
+                break
+            start = 0
+            while start < len(data):
                 if waiting_cmd:
                     waiting_cmd = False
-                    if data in DETACH_KEYS:
-                        await ws.close()
+                    if not await command(data[start:start + 1]):
                         return
-                    elif data in HELP_KEYS:
-                        print("\r")
-                        print("    Ctrl-B ? : Affiche l'aide\r")
-                        print("    Ctrl-B D : Détache la console\r")
-                        print("    Ctrl-B H : Arrête la VM\r")
-                        print("    Ctrl-B S : Force l'arrêt de la VM\r")
-                        print("    Ctrl-B R : Redémarre la VM\r")
-                        print("    Ctrl-B B : Envoie Ctrl-B a la console\r")
-                    elif data in HALT_KEYS:
-                        api_request("post", f"/vm/{vm_id}/powerbutton", session_token)
-                    elif data in STOP_KEYS:
-                        api_request("post", f"/vm/{vm_id}/stop", session_token)
-                    elif data in RESET_KEYS:
-                        api_request("post", f"/vm/{vm_id}/restart", session_token)
-                    elif data in PASSTHRU_KEYS:
-                        await ws.send(CTRL_B)
-                    else:
-                        await ws.send(CTRL_B + data)
+                    start += 1
                     continue
-
-                if data == CTRL_B:
-                    waiting_cmd = True
+                end = data.find(CTRL_B, start)
+                if end < 0:
+                    end = len(data)
                 else:
-                    await ws.send(data)
+                    waiting_cmd = True
+                if end > start:
+                    await send(data[start:end])
+                start = end + 1 if waiting_cmd else end
+
+    sys.stdout.flush()
+    output = output_open(loop, sys.stdout.fileno())
+    rx_task = asyncio.create_task(rx())
+    tx_task = asyncio.create_task(tx())
+    try:
+        # The console ends with its output, or on an input error; output
+        # keeps coming after the end of stdin or a detach until closed.
+        await asyncio.wait([rx_task, tx_task], return_when=asyncio.FIRST_COMPLETED)
+        if tx_task.done() and not tx_task.exception():
+            await asyncio.wait([rx_task])
+    finally:
+        for task in (rx_task, tx_task):
+            task.cancel()
+        await asyncio.gather(rx_task, tx_task, return_exceptions=True)
+        await output_close(output)
+    for task in (tx_task, rx_task):
+        if not task.cancelled() and task.exception():
+            raise task.exception()
+
+async def console_link(session_token, vm_id):
+    from websockets.exceptions import ConnectionClosed
+
+    path = f"/vm/{vm_id}/console"
+    counters = ws_counters()
+    start = time.perf_counter()
+
+    async def messages():
+        async for msg in ws:
+            counters["frames_in"] += 1
+            counters["bytes_in"] += len(msg)
+            yield msg
+
+    async def send(data):
+        counters["frames_out"] += 1
+        counters["bytes_out"] += len(data)
+        await ws.send(data)
+
+    ws = await ws_connect(session_token, path, subprotocols=['binary'])
+    try:
+        with metrics_session("console", vm_id, counters):
+            async with ws:
+                await console_io(session_token, vm_id, messages(), send, ws.close)
+    except ConnectionClosed:
+        return
+    finally:
+        trace_ws(path, start, counters, ws)
+
+def runtime_socket_path(name):
+    """Path of the Unix socket `name`.
+
+    It lives in $XDG_RUNTIME_DIR, or in the cache directory, and is named
+    after the token file like the per-box caches.
+    """
+    path = cache_path(name)
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        path = os.path.join(runtime_dir, "freeboxvm", os.path.basename(path))
+    return os.path.splitext(path)[0] + ".sock"
+
+def console_socket_path(vm_id):
+    """Default Unix socket of the console server of a VM."""
+    return runtime_socket_path(f"console-{vm_id}")
+
+async def open_console_socket(address):
+    """Connect to a console server at `address`, a Unix socket path or
+    HOST:PORT. Returns (reader, writer), or None if nothing listens there."""
+    try:
+        if os.sep in address or ":" not in address:
+            return await asyncio.open_unix_connection(address)
+        host, port = address.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port))
+    except (OSError, ValueError):
+        return None
+
+async def console_attach(session_token, vm_id, reader, writer, read_only=False):
+    """Use the console shared by a console server.
 
+    Returns False if the connection was refused.
+    """
+    writer.write(b"ro\n" if read_only else b"rw\n")
+    try:
+        role = (await reader.readline()).strip()
+    except ConnectionError:
+        role = b""
+    if role not in (b"writer", b"reader"):
+        writer.close()
+        return False
+    if role == b"reader":
+        print("Console en lecture seule, un autre client a la main.\r", file=sys.stderr)
+    state = { "writer": role == b"writer", "tail": b"" }
+
+    async def messages():
+        while data := await reader.read(CONSOLE_READ_SIZE):
+            # the server notifies in-band the client taking over
+            if not state["writer"]:
+                state["writer"] = CONSOLE_TAKEOVER in state["tail"] + data
+                state["tail"] = (state["tail"] + data)[-len(CONSOLE_TAKEOVER):]
+            yield data
+
+    async def send(data):
+        writer.write(data)
+        await writer.drain()
+
+    async def close():
+        writer.close()
+
+    try:
+        await console_io(session_token, vm_id, messages(), send, close, read_only,
+                         lambda: state["writer"])
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+    return True
+
+async def run_console_server(session_token, vm_id, path=None, host=None, port=None, metrics=None):
+    """Share the console of a VM between local clients.
+
+    One console websocket is kept open (and reopened when it closes, e.g.
+    while the VM is stopped) and served on the Unix socket `path`, or on
+    host:port. Each client first sends 'rw' or 'ro' and gets 'writer' or
+    'reader' back, then the last CONSOLE_SCROLLBACK bytes of output and the
+    console stream. Only the writer's input reaches the VM; when it leaves,
+    the oldest remaining 'rw' client takes over. Clients more than
+    CONSOLE_CLIENT_BACKLOG bytes behind are dropped. With `metrics`, a
+    (host, port) tuple, the metrics are served there (see `metrics_serve`).
+    """
+    ws_preload()
+    from websockets.exceptions import ConnectionClosed, WebSocketException
+
+    stop = stop_on_signals()
+    state = { "ws": None, "writer": None, "clients": { }, "scrollback": bytearray() }
+    counters = ws_counters()
+
+    def broadcast(data):
+        state["scrollback"] += data
+        del state["scrollback"][:-CONSOLE_SCROLLBACK]
+        for client in [ client for client in state["clients"]
+                        if client.transport.get_write_buffer_size() > CONSOLE_CLIENT_BACKLOG ]:
+            client.close()
+            del state["clients"][client]
+            metric_add("freeboxvm_console_dropped_clients_total", vm=vm_id)
+        for client in state["clients"]:
+            client.write(data)
+
+    async def upstream():
+        connected = False
+        while True:
+            if connected:
+                metric_add("freeboxvm_ws_reconnects_total", service="console", vm=vm_id)
+            try:
+                async with await ws_connect(session_token, f"/vm/{vm_id}/console",
+                                            subprotocols=['binary']) as ws:
+                    state["ws"] = ws
+                    connected = True
+                    async for msg in ws:
+                        data = msg.encode() if isinstance(msg, str) else msg
+                        counters["frames_in"] += 1
+                        counters["bytes_in"] += len(data)
+                        broadcast(data)
+            except (OSError, asyncio.TimeoutError, WebSocketException):
+                metric_add("freeboxvm_tunnel_errors_total", service="console", vm=vm_id)
+            finally:
+                state["ws"] = None
+            await asyncio.sleep(CONSOLE_RECONNECT_DELAY)
+
+    async def client(reader, writer):
         try:
-            await asyncio.gather(rx(), tx())
-        except ConnectionClosed:
+            mode = (await asyncio.wait_for(reader.readline(), 5)).strip()
+        except (asyncio.TimeoutError, ConnectionError):
+            writer.close()
             return
+        if mode not in (b"rw", b"ro"):
+            writer.close()
+            return
+        if mode == b"rw" and state["writer"] is None:
+            state["writer"] = writer
+        writer.write(b"writer\n" if state["writer"] is writer else b"reader\n")
+        writer.write(bytes(state["scrollback"]))
+        state["clients"][writer] = (mode == b"rw")
+        metric_add("freeboxvm_clients", 1, service="console", vm=vm_id)
+        try:
+            while data := await reader.read(CONSOLE_READ_SIZE):
+                if state["writer"] is writer and state["ws"] is not None:
+                    try:
+                        counters["frames_out"] += 1
+                        counters["bytes_out"] += len(data)
+                        await state["ws"].send(data)
+                    except ConnectionClosed:
+                        pass
+        except ConnectionError:
+            pass
+        finally:
+            metric_add("freeboxvm_clients", -1, service="console", vm=vm_id)
+            state["clients"].pop(writer, None)
+            if state["writer"] is writer:
+                state["writer"] = next((other for other, rw in state["clients"].items() if rw), None)
+                if state["writer"] is not None:
+                    state["writer"].write(CONSOLE_TAKEOVER)
+            writer.close()
+
+    if path:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        if os.path.exists(path):
+            existing = await open_console_socket(path)
+            if existing:
+                existing[1].close()
+                print(f"Un serveur de console écoute déjà sur {path}", file=sys.stderr)
+                sys.exit(1)
+            os.unlink(path)
+        umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(client, path)
+        finally:
+            os.umask(umask)
+        print(f"Console de la VM #{vm_id} partagée sur {path}")
+    else:
+        server = await asyncio.start_server(client, host, port)
+        print(f"Console de la VM #{vm_id} partagée sur {host}:{port}")
+    metrics_server = await metrics_serve(metrics) if metrics else None
+
+    link = asyncio.create_task(upstream())
+    try:
+        with metrics_session("console", vm_id, counters):
+            await stop
+    finally:
+        if metrics_server:
+            metrics_server.close()
+        # close the clients first: the server waits for them when closed
+        for client_writer in state["clients"]:
+            client_writer.close()
+        server.close()
+        if state["ws"] is not None:
+            await state["ws"].close()
+        link.cancel()
+        await asyncio.gather(link, return_exceptions=True)
+        if path and os.path.exists(path):
+            os.unlink(path)
+    print("Arrêt du serveur de console...")
 
 def system_info(session_token):
     info = api_request("get", "/vm/info/", session_token)
+    if not info or info == "forbidden":
+        print("Échec de la lecture des informations système")
+        return
     print(f"Mémoire totale : {info['total_memory']}\tMémoire utilisée : {info['used_memory']}\t({info['used_memory'] * 100 / info['total_memory']} %)")
     print(f"Nombre de CPU : {info['total_cpus']}\tCPU utilisés : {info['used_cpus']}\t({info['used_cpus'] * 100 / info['total_cpus']} %)")
     print(f"USB externe alloué : {'Oui' if info['usb_used'] else 'Non'}")
@@ -264,9 +1686,45 @@ def system_info(session_token):
     print(f"VMs directory path: {search_VMs(session_token, '/')}")
 
 def get_vm_list(session_token):
-    vm_list = api_request("get", "/vm/", session_token)
+    """Return the VM list.
+
+    The list is kept VM_LIST_TTL seconds in memory and in the 'vm_list'
+    cache, and dropped by `api_request` after any call changing a VM. The
+    copy in memory is also dropped when the cache changes, e.g. when another
+    process changed a VM.
+    """
+    mtime = cache_mtime("vm_list")
+    if _vm_cache["list"] is not None and not _cache["disabled"] and \
+       time.monotonic() - _vm_cache["time"] < VM_LIST_TTL and mtime == _vm_cache["mtime"]:
+        return _vm_cache["list"]
+
+    vm_list = load_cache("vm_list", ttl=VM_LIST_TTL)
+    if vm_list is None:
+        vm_list = api_request("get", "/vm/", session_token, empty=[ ])
+        if vm_list is None or vm_list == "forbidden":
+            return None
+        save_cache("vm_list", vm_list)
+        mtime = cache_mtime("vm_list")
+
+    # a list read from the cache is as old as the cache, not fresh
+    age = max(0.0, time.time() - mtime) if mtime is not None else 0.0
+    _vm_cache.update(list=vm_list, time=time.monotonic() - age, mtime=mtime,
+                     index=index_vms(vm_list))
     return vm_list
 
+def index_vms(vm_list):
+    """Index a VM list by id and by name."""
+    index = { 'id': { }, 'name': { } }
+    for vm in vm_list:
+        index['id'][int(vm['id'])] = vm
+        index['name'].setdefault(vm['name'], []).append(vm)
+    return index
+
+def invalidate_vm_list():
+    """Forget the cached VM list."""
+    _vm_cache.update(list=None, index=None)
+    drop_cache("vm_list")
+
 def display_info(vm, args):
     if not args.long:
         print(f"{vm['id']}\t{vm.get('status')}\t{vm.get('name')}")
@@ -324,24 +1782,95 @@ def list(session_token, args):
         display_info(vm, args)
 
 def distro_check(url, hash):
-    try:
-        r = requests.head(url, allow_redirects=True, timeout=5)
-        if not r.status_code == 200:
-            return False
-    except requests.RequestException:
+    """Check that an image URL and its checksum URL (if any) are reachable."""
+    if not url_check(url):
         return False
 
     if not hash:
         return True
 
+    return url_check(hash)
+
+def url_check(url):
+    """HEAD `url`, following redirects, and tell if it answers 200.
+
+    Definite answers are kept URL_CHECK_TTL seconds in the 'url_check'
+    cache (see `url_check_save`); network errors, timeouts and server
+    errors are not, so that the URL is probed again on the next run. Probe
+    latencies are recorded by host.
+    """
+    checks = url_checks()
+    cached = checks["results"].get(url)
+    if cached and time.time() - cached[1] < URL_CHECK_TTL:
+        return cached[0]
+
+    start = time.monotonic()
     try:
-        r = requests.head(hash, allow_redirects=True, timeout=5)
-        if not r.status_code == 200:
-            return False
+        r = probe_session().head(url, allow_redirects=True, timeout=5)
+        valid = r.status_code == 200
+        definite = r.status_code < 500 and r.status_code != 429
     except requests.RequestException:
-        return False
-
-    return True
+        valid = definite = False
+    host = urlparse(url).hostname
+    checks["latency"].setdefault(host, []).append(time.monotonic() - start)
+    if definite:
+        checks["results"][url] = (valid, time.time())
+    return valid
+
+def url_checks():
+    """Return the URL check results and the probe latencies of this process."""
+    if _url_checks["results"] is None:
+        cached = load_cache("url_check", per_box=False) or { }
+        now = time.time()
+        _url_checks["results"] = { url: tuple(result) for url, result in cached.items()
+                                   if now - result[1] < URL_CHECK_TTL }
+    return _url_checks
+
+def url_check_save():
+    """Persist the URL check results."""
+    if _url_checks["results"] is not None:
+        save_cache("url_check", _url_checks["results"], per_box=False)
+
+def probe_session():
+    """Return the `requests.Session` used to probe distribution mirrors.
+
+    Its pool keeps connections open per mirror host for all the probe
+    threads.
+    """
+    if _http["probe"] is None:
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=_url_checks["jobs"])
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http["probe"] = session
+    return _http["probe"]
+
+def distro_check_all(rows, jobs):
+    """Run `distro_check` on (distro, hash) rows with up to `jobs` probes in
+    flight, and yield (distro, hash, valid) in the order of `rows`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    _url_checks["jobs"] = jobs
+    probe_session()  # imports requests before the workers use it
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(lambda row: (*row, distro_check(row[0]['url'], row[1])),
+                                rows)
+    url_check_save()
+
+def print_probe_latency():
+    """Print per-host statistics of the probes made by `url_check`."""
+    latency = _url_checks["latency"]
+    if not latency:
+        return
+    print("Latence des sondes par hôte :", file=sys.stderr)
+    for host, delays in sorted(latency.items()):
+        delays = sorted(delays)
+        median = delays[len(delays) // 2]
+        print(f"  {host}\t{len(delays)} sondes\tmédiane {median * 1000:.0f} ms\tmax {delays[-1] * 1000:.0f} ms",
+              file=sys.stderr)
 
 def distro_get_hash(os_name, url):
     base_url = url.rsplit("/", 1)[0] + "/"
@@ -378,16 +1907,97 @@ def distro_get_hash(os_name, url):
 
     return sha_url
 
-def get_list_iso():
+def osinfo_db_dirs():
+    """Directories read by `Libosinfo.Loader.process_default_path()`."""
+    return [
+        os.environ.get("OSINFO_SYSTEM_DIR", "/usr/share/osinfo"),
+        os.environ.get("OSINFO_DATA_DIR", "/usr/share/libosinfo/db"),
+        os.environ.get("OSINFO_LOCAL_DIR", "/etc/osinfo"),
+        os.environ.get("OSINFO_USER_DIR",
+                       os.path.join(os.environ.get("XDG_CONFIG_HOME",
+                                                   os.path.expanduser("~/.config")),
+                                    "osinfo")),
+    ]
+
+def osinfo_fingerprint():
+    """Digest of the names, sizes and mtimes of the osinfo database files."""
+    digest = hashlib.sha1()
+    for db_dir in osinfo_db_dirs():
+        for root, dirs, files in os.walk(db_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                digest.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def osinfo_catalog():
+    """Return the aarch64 entries of the osinfo database.
+
+    Loading the database through GObject introspection is slow, so the
+    entries are cached on disk with an index by short-id, and only reloaded
+    when the database files change.
+
+    Returns
+    -------
+    dict
+        'iso' and 'extra' entry lists, without their checksum URL (see
+        `osinfo_entry`), and 'index' mapping each list name to
+        {short-id: [positions in the list]}.
+    """
+    if _osinfo["catalog"] is not None:
+        return _osinfo["catalog"]
+
+    fingerprint = osinfo_fingerprint()
+    catalog = load_cache("osinfo", per_box=False)
+    if not catalog or catalog.get("version") != OSINFO_CACHE_VERSION or \
+       catalog.get("fingerprint") != fingerprint:
+        catalog = osinfo_load()
+        catalog["version"] = OSINFO_CACHE_VERSION
+        catalog["fingerprint"] = fingerprint
+        save_cache("osinfo", catalog, per_box=False)
+
+    _osinfo["catalog"] = catalog
+    return catalog
+
+def osinfo_load():
+    """Extract the aarch64 catalog from the osinfo database (see `osinfo_catalog`)."""
     import gi
     gi.require_version('Libosinfo', '1.0')
     from gi.repository import Libosinfo
-    distro_list = [ ]
 
     loader = Libosinfo.Loader()
     loader.process_default_path()
     db = loader.get_db()
 
+    catalog = { 'iso': [ entry for entry in osinfo_iso_entries(db) ],
+                'extra': [ entry for entry in osinfo_extra_entries(db) ] }
+    catalog['index'] = { }
+    for kind in ('iso', 'extra'):
+        index = catalog['index'][kind] = { }
+        for i, entry in enumerate(catalog[kind]):
+            index.setdefault(entry['short-id'], []).append(i)
+    return catalog
+
+def osinfo_lookup(kind, short_id):
+    """Return the first 'iso' or 'extra' catalog entry for `short_id`, or None."""
+    catalog = osinfo_catalog()
+    positions = catalog['index'][kind].get(short_id)
+    return osinfo_entry(catalog[kind][positions[0]]) if positions else None
+
+def osinfo_entry(entry):
+    """Complete a catalog entry with its checksum URL."""
+    return dict(entry, hash=distro_get_hash(entry['os'], entry['url']))
+
+def get_list_iso():
+    """Yield the osinfo ISO entries, without their checksum URL."""
+    for entry in osinfo_catalog()['iso']:
+        yield dict(entry)
+
+def osinfo_iso_entries(db):
     os_list = db.get_os_list()
     num_oses = os_list.get_length()
 
@@ -399,29 +2009,24 @@ def get_list_iso():
 
         distro_os = os_obj.get_distro()
         distro_name = os_obj.get_name()
-        distro_version = os_obj.get_version()
 
         for media in medias:
             distro_url = media.get_param_value('url')
             if not distro_url or not media.get_architecture() == 'aarch64':
                 continue
 
-            distro_hash = distro_get_hash(distro_os, distro_url)
-            entry = {
+            yield {
                 'name': distro_name,
                 'short-id': os_obj.get_short_id(),
                 'os': distro_os,
                 'url': distro_url,
-                'hash': distro_get_hash(distro_os, distro_url),
                 'live': media.get_live()
             }
-            distro_list.append(entry)
-    return distro_list
 
 def get_list_distro(session_token):
-    distro_list = [ ]
-
     freebox_list = api_request("get", "/vm/distros/", session_token)
+    if not freebox_list or freebox_list == "forbidden":
+        return
 
     for distro in freebox_list:
         entry = {
@@ -441,19 +2046,27 @@ def get_list_distro(session_token):
 
         if distro.get('hash'):
             entry['hash'] = distro.get('hash')
-        distro_list.append(entry)
-    return distro_list
+        yield entry
 
 def get_list_extra_distro():
-    import gi
-    gi.require_version('Libosinfo', '1.0')
-    from gi.repository import Libosinfo
-    distro_list = [ ]
+    """Yield the osinfo cloud image entries, without their checksum URL."""
+    for entry in osinfo_catalog()['extra']:
+        yield dict(entry)
 
-    loader = Libosinfo.Loader()
-    loader.process_default_path()
-    db = loader.get_db()
+def find_distro(session_token, short_id, iso=False):
+    """Return the first distribution entry matching `short_id`, or None.
 
+    ISO images are looked up in the osinfo catalog; cloud images in the
+    Freebox list first, then in the osinfo catalog. The search stops at the
+    first match.
+    """
+    if iso:
+        return osinfo_lookup('iso', short_id)
+    distro = next((item for item in get_list_distro(session_token)
+                   if item.get('short-id') == short_id), None)
+    return distro or osinfo_lookup('extra', short_id)
+
+def osinfo_extra_entries(db):
     os_list = db.get_os_list()
     num_oses = os_list.get_length()
 
@@ -475,18 +2088,13 @@ def get_list_extra_distro():
 
         distro_name = os_obj.get_name()
         for img in ci_images:
-            distro_url = img.get_param_value('url')
-            entry = {
+            yield {
                 'name': distro_name,
                 'short-id': os_obj.get_short_id(),
                 'os': distro_os,
-                'url': distro_url,
-                'hash': distro_get_hash(distro_os, distro_url),
+                'url': img.get_param_value('url'),
                 'variant': img.get_param_value("variant"),
             }
-            distro_list.append(entry)
-
-    return distro_list
 
 def list_distro(session_token, args):
 
@@ -497,24 +2105,34 @@ def list_distro(session_token, args):
     else:
         distro_list = get_list_distro(session_token)
 
-    if not distro_list:
-        print("Pas de distribution disponible", file=sys.stderr)
-        return
+    empty = True
 
-    for distro in distro_list:
-        distro_os = distro['os']
+    def rows():
+        nonlocal empty
+        for distro in distro_list:
+            empty = False
+            distro_os = distro['os']
 
-        if args.os and not distro_os in args.os:
-            continue
+            if args.os and not distro_os in args.os:
+                continue
+
+            distro_hash = distro.get('hash')
+            if not distro_hash:
+                distro_hash = distro_get_hash(distro_os, distro['url'])
+            yield distro, distro_hash
+
+    if args.check:
+        checked_rows = distro_check_all(rows(), args.jobs)
+    else:
+        checked_rows = ((distro, distro_hash, True) for distro, distro_hash in rows())
 
+    for distro, distro_hash, valid in checked_rows:
+        distro_os = distro['os']
         distro_url = distro['url']
         distro_name = distro['name']
-        distro_hash = distro.get('hash')
 
         print(f"{distro_name} ({distro.get('short-id')}{f', {distro.get('variant')}' if distro.get('variant') else ''}){' [Live CD]' if distro.get('live') else ''}")
-        if not distro_hash:
-            distro_hash = distro_get_hash(distro_os, distro_url)
-        if args.check and not distro_check(distro_url, distro_hash):
+        if not valid:
             print(f"\t-> URL/HASH invalide")
 
         if args.long:
@@ -522,31 +2140,140 @@ def list_distro(session_token, args):
             print(f"\t{distro_url}")
             print(f"\t{distro_hash if distro_hash else 'Aucune URL de hash/somme de contrôle'}")
 
+    if empty:
+        print("Pas de distribution disponible", file=sys.stderr)
+
+    if args.check:
+        print_probe_latency()
+
+def match_vms(vm_list, selector):
+    """Return the VMs of `vm_list` matching an ID, a name or a name glob."""
+    if vm_list is _vm_cache["list"]:
+        index = _vm_cache["index"]
+    else:
+        index = index_vms(vm_list)
+
+    try:
+        match = index['id'].get(int(selector))
+        if match:
+            return [ match ]
+    except ValueError:
+        pass
+
+    if any(c in selector for c in "*?["):
+        import fnmatch
+        return [ vm for vm in vm_list if fnmatch.fnmatchcase(vm["name"], selector) ]
+
+    return index['name'].get(selector, [ ])
+
+def print_matches(matches):
+    print("Plusieurs correspondances :", file=sys.stderr)
+    for vm in matches:
+        print(f"  {vm['id']}: {vm['name']} {vm.get('status')}", file=sys.stderr)
+
 def select_vm(session_token, selector):
     vm_list = get_vm_list(session_token)
     if not vm_list:
         return None
 
-    try:
-        wanted_id = int(selector)
-        match = next((vm for vm in vm_list if int(vm["id"]) == wanted_id), None)
-        if match:
-            return match
-    except ValueError:
-        pass
-
-    matches = [ vm for vm in vm_list if selector == vm["name"]]
+    matches = match_vms(vm_list, selector)
     if len(matches) == 1:
         return matches[0]
 
     if len(matches) > 1:
-        print("Plusieurs correspondances :", file=sys.stderr)
-        for vm in matches:
-            print(f"  {vm['id']}: {vm['name']} {vm.get('status')}", file=sys.stderr)
+        print_matches(matches)
         return None
 
     return None
 
+def select_vms(session_token, args):
+    """Resolve the VM selectors of a batch command with a single VM list.
+
+    Selectors are IDs, names or name globs (args.vm); args.all selects every
+    VM and args.status keeps only the VMs in that state. Exits on unknown or
+    ambiguous selectors.
+
+    Returns
+    -------
+    list[dict]
+        The selected VMs, in the order of the VM list.
+    """
+    if not args.vm and not args.all:
+        print("Indiquez au moins une VM, ou --all", file=sys.stderr)
+        sys.exit(1)
+
+    vm_list = get_vm_list(session_token) or [ ]
+    selected = set(vm['id'] for vm in vm_list) if args.all else set()
+    for selector in args.vm:
+        matches = match_vms(vm_list, selector)
+        if not matches:
+            print(f"VM non trouvée : {selector}. Utilisez 'freeboxvm list' pour voir la liste.",
+                  file=sys.stderr)
+            sys.exit(1)
+        if len(matches) > 1 and not any(c in selector for c in "*?["):
+            print_matches(matches)
+            sys.exit(1)
+        selected.update(vm['id'] for vm in matches)
+
+    vms = [ vm for vm in vm_list if vm['id'] in selected and
+            (not args.status or vm.get('status') in args.status) ]
+    if not vms:
+        print("Aucune VM sélectionnée", file=sys.stderr)
+        sys.exit(1)
+    return vms
+
+def run_batch(vms, action, jobs):
+    """Run the coroutine function `action(vm)` on each VM, at most `jobs` at
+    a time. `action` returns None on success, or an error message.
+
+    Returns
+    -------
+    list[tuple[dict, str | None, float]]
+        (vm, error, duration in seconds) for each VM, in the order of `vms`.
+    """
+    async def run_all():
+        semaphore = asyncio.Semaphore(jobs)
+
+        async def run(vm):
+            async with semaphore:
+                start = time.monotonic()
+                error = await action(vm)
+                return vm, error, time.monotonic() - start
+
+        return await asyncio.gather(*(run(vm) for vm in vms))
+
+    return asyncio.run(run_all())
+
+def report_batch(results):
+    """Print the outcome of `run_batch`, and exit with an error if any VM
+    failed. A summary table is printed when there are several VMs.
+    """
+    if len(results) > 1:
+        print("ID\tNOM\tRÉSULTAT\tDURÉE")
+        for vm, error, duration in results:
+            print(f"{vm['id']}\t{vm['name']}\t{error if error else 'ok'}\t{duration:.2f} s")
+    else:
+        for vm, error, duration in results:
+            if error:
+                print(error, file=sys.stderr)
+    if any(error for vm, error, duration in results):
+        sys.exit(1)
+
+async def vm_power(session_token, vm, action, state, args):
+    """Send a power `action` to a VM and, with args.wait, wait until it
+    reaches `state`. Returns None on success, or an error message.
+    """
+    res = await api_request_async("post", f"/vm/{vm['id']}/{action}", session_token)
+    if not res or res == "forbidden":
+        return "Échec de la requête"
+    if args.wait:
+        vm = await wait_vm_state_async(session_token, vm['id'], [ state ], args.wait_timeout)
+        if not vm:
+            return "État de la VM illisible"
+        if vm['status'] != state:
+            return f"Délai d'attente dépassé, la VM est dans l'état {vm['status']}"
+    return None
+
 def show(session_token, args):
     vm = select_vm(session_token, args.vm)
     if not vm:
@@ -561,91 +2288,341 @@ def show(session_token, args):
     display_info(vm, args)
 
 def delete(session_token, args):
-    vm = select_vm(session_token, args.vm)
-    if not vm:
-        print("VM non trouvée. Utilisez 'freeboxvm list' pour voir la liste.", file=sys.stderr)
-        sys.exit(1)
-
-    if vm['status'] != 'stopped':
-        if args.force:
-            print("La VM est allumée, destruction forcée")
-            api_request("post", f"/vm/{vm['id']}/stop", session_token)
-            while vm['status'] != 'stopped':
-                time.sleep(0.2)
-                vm = api_request("get", f"/vm/{vm['id']}", session_token)
-        else:
-            print(f"La VM est allumée ({vm['status']}), annulation de l'effacement")
-            return
+    vms = select_vms(session_token, args)
+
+    async def delete_vm(vm):
+        # the selection may come from a cached VM list
+        vm = await api_request_async("get", f"/vm/{vm['id']}", session_token)
+        if not vm or vm == "forbidden":
+            return "État de la VM illisible"
+        if vm['status'] != 'stopped':
+            if args.force:
+                print(f"La VM '{vm['name']}' est allumée, destruction forcée")
+                res = await api_request_async("post", f"/vm/{vm['id']}/stop", session_token)
+                if not res or res == "forbidden":
+                    return "Échec de l'arrêt de la VM"
+                vm = await wait_vm_state_async(session_token, vm['id'], [ 'stopped' ],
+                                               args.wait_timeout)
+                if not vm:
+                    return "État de la VM illisible"
+                if vm['status'] != 'stopped':
+                    return f"Délai d'attente dépassé, la VM est dans l'état {vm['status']}"
+            else:
+                return f"La VM est allumée ({vm['status']}), annulation de l'effacement"
+
+        disk_path_b64 = vm['disk_path']
+        res = await api_request_async("delete", f"/vm/{vm['id']}", session_token)
+        if not res or res == "forbidden":
+            return "Échec de la requête"
+        if args.disk and disk_path_b64:
+            efivars_path = base64.b64decode(disk_path_b64).decode('utf-8') + '.efivars'
+            efivars_path_b64 = base64.b64encode(efivars_path.encode("utf-8")).decode("ascii")
+            await api_request_async("post", "/fs/rm/", session_token, json={ 'files': [ efivars_path_b64 ] })
+            await api_request_async("post", "/fs/rm/", session_token, json={ 'files': [ disk_path_b64 ] })
+        return None
 
-    disk_path_b64 = vm['disk_path']
-    api_request("delete", f"/vm/{vm['id']}", session_token)
-    if args.disk and disk_path_b64:
-        efivars_path = base64.b64decode(disk_path_b64).decode('utf-8') + '.efivars'
-        efivars_path_b64 = base64.b64encode(efivars_path.encode("utf-8")).decode("ascii")
-        api_request("post", "/fs/rm/", session_token, json={ 'files': [ efivars_path_b64 ] })
-        api_request("post", "/fs/rm/", session_token, json={ 'files': [ disk_path_b64 ] })
+    report_batch(run_batch(vms, delete_vm, args.jobs))
 
 def get_file(session_token, request, background):
-    resp = api_request("post", "/downloads/add", session_token, data=request)
-    if not resp:
-       print("Échec")
-       return
+    return get_files(session_token, [ request ], background)[0]
+
+def get_files(session_token, requests_list, background):
+    """Download files with the Freebox download manager.
 
+    All the downloads are queued at once and followed together (see
+    `download_files`). Failed downloads are erased; downloads that could
+    not be followed to their end are left running on the Freebox.
+
+    Returns
+    -------
+    list[str | None]
+        Path of each downloaded file on the Freebox, None when the download
+        failed or runs in the background.
+    """
     if background:
-        print("Téléchargement démarré sur la Freebox, consultez l'utilitaire « Téléchargements »")
-        return None
+        started = False
+        for request in requests_list:
+            resp = api_request("post", "/downloads/add", session_token, data=request)
+            if not resp or resp == "forbidden":
+                print("Échec")
+            else:
+                started = True
+        if started:
+            print("Téléchargement démarré sur la Freebox, consultez l'utilitaire « Téléchargements »")
+        return [ None ] * len(requests_list)
 
-    task_id = resp['id']
+    state = { 'task_ids': [ None ] * len(requests_list) }
     try:
-        filesize = 0
-        while not filesize:
-            time.sleep(0.1)
-            task = api_request("get", f"/downloads/{task_id}", session_token)
-            if task['status'] != 'downloading':
-                break
-            filesize = task['size']
+        tasks = asyncio.run(download_files(session_token, requests_list, state))
+    except KeyboardInterrupt:
+        # On Ctrl-C remove the tasks and the files
+        for task_id in state['task_ids']:
+            if task_id is not None:
+                api_request("delete", f"/downloads/{task_id}/erase", session_token)
+        print("Interrompu... fichier effacé")
+        return [ None ] * len(requests_list)
+
+    filepaths = [ ]
+    for request, task_id, task in zip(requests_list, state['task_ids'], tasks):
+        label = f"{request['download_url']} : " if len(requests_list) > 1 else ""
+        if task_id is None:
+            print(f"{label}Échec")
+            filepaths.append(None)
+        elif task and task['status'] == 'missing':
+            print(f"{label}Échec")
+            filepaths.append(None)
+        # The Freebox stopped answering: the download may still succeed
+        elif not task or task['status'] in DOWNLOAD_ACTIVE:
+            print(f"{label}Suivi interrompu, le téléchargement continue sur la Freebox")
+            filepaths.append(None)
+        elif task['status'] != 'done':
+            print(f"{label}Erreur de téléchargement... fichier effacé")
+            api_request("delete", f"/downloads/{task_id}/erase", session_token)
+            filepaths.append(None)
+        # On success remove the task but keep the file
+        else:
+            destdir = base64.b64decode(task['download_dir']).decode('utf-8')
+            filepaths.append(os.path.join(destdir, task['name']))
+            api_request("delete", f"/downloads/{task_id}", session_token)
+    return filepaths
 
-        rxsize = 0
-        lastrxsize = 0
-        t = tqdm(total=filesize,unit_scale=True,unit='o')
+@asynccontextmanager
+async def subscribe_events(session_token, events):
+    """Open the Freebox event websocket and register to `events`.
 
-        while rxsize != filesize:
-            task = api_request("get", f"/downloads/{task_id}", session_token)
-            if task['status'] != 'downloading':
-                break
-            rxsize = task['rx_bytes']
-            t.update(rxsize - lastrxsize)
-            lastrxsize = rxsize
-            time.sleep(0.1)
-        t.close()
-        task = api_request("get", f"/downloads/{task_id}", session_token)
-        if task['status'] == 'checking':
-            print("Vérification du SHA")
-        while True:
-            task = api_request("get", f"/downloads/{task_id}", session_token)
-            if task['status'] != 'checking':
+    Yields the websocket, or None if the event stream is not available, in
+    which case the caller is expected to poll the API instead.
+    """
+    from websockets.exceptions import WebSocketException
+
+    try:
+        ws = await ws_connect(session_token, "/ws/event/", open_timeout=5)
+    except (OSError, asyncio.TimeoutError, WebSocketException):
+        yield None
+        return
+
+    try:
+        registered = False
+        try:
+            await ws.send(json.dumps({ "action": "register", "events": events }))
+            reply = json.loads(await asyncio.wait_for(ws.recv(), 5))
+            registered = reply.get("action") == "register" and reply.get("success")
+        except (ValueError, asyncio.TimeoutError, WebSocketException):
+            pass
+        yield ws if registered else None
+    finally:
+        await ws.close()
+
+async def watch_events(ws, source, match, wake):
+    """Set the asyncio.Event `wake` on each notification from `source`
+    whose result satisfies `match`, until the event websocket is closed.
+    """
+    from websockets.exceptions import ConnectionClosed
+
+    try:
+        async for msg in ws:
+            try:
+                data = json.loads(msg)
+            except ValueError:
+                continue
+            if data.get("action") == "notification" and data.get("source") == source and \
+               match(data.get("result", {})):
+                wake.set()
+    except ConnectionClosed:
+        pass
+
+def wait_vm_state(session_token, vm_id, states, timeout=None):
+    """Wait until a VM reaches one of `states` (see `wait_vm_state_async`)."""
+    return asyncio.run(wait_vm_state_async(session_token, vm_id, states, timeout))
+
+async def wait_vm_state_async(session_token, vm_id, states, timeout=None):
+    """Wait until a VM reaches one of `states`, or `timeout` seconds.
+
+    The VM is read again on each vm_state_changed notification, and every
+    VM_POLL_MAX seconds in case a notification is lost. Without the event
+    websocket, it is polled with a backoff from VM_POLL_MIN to VM_POLL_MAX
+    seconds.
+
+    Returns
+    -------
+    dict | None
+        The last state of the VM read from the API, whose 'status' is not
+        in `states` on timeout; None if the VM could not be read.
+    """
+    if timeout is None:
+        timeout = VM_WAIT_TIMEOUT
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    async with subscribe_events(session_token, [ "vm_state_changed" ]) as ws:
+        changed = None
+        if ws:
+            changed = asyncio.Event()
+            watcher = asyncio.create_task(watch_events(ws, "vm",
+                                                       lambda result: result.get("id") == vm_id,
+                                                       changed))
+        try:
+            delay = VM_POLL_MIN
+            while True:
+                vm = await api_request_async("get", f"/vm/{vm_id}", session_token)
+                if not vm or vm == "forbidden":
+                    return None
+                remaining = deadline - loop.time()
+                if vm['status'] in states or remaining <= 0:
+                    return vm
+
+                if changed is not None:
+                    try:
+                        await asyncio.wait_for(changed.wait(), min(VM_POLL_MAX, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                    changed.clear()
+                else:
+                    await asyncio.sleep(min(delay, remaining))
+                    delay = min(delay * 1.5, VM_POLL_MAX)
+        finally:
+            if ws:
+                watcher.cancel()
+                with suppress(asyncio.CancelledError):
+                    await watcher
+
+async def download_files(session_token, requests_list, state):
+    """Add download tasks and follow them until they end.
+
+    The end of a task is notified on the event websocket; the API is only
+    polled to update the progress bars. Without events, the API is polled
+    with a backoff from DOWNLOAD_POLL_MIN to DOWNLOAD_POLL_MAX seconds.
+
+    Returns
+    -------
+    list[dict | None]
+        The last state of each task, None if it could not be added or read.
+        Task ids are stored in state['task_ids'] as soon as they exist.
+    """
+    async with subscribe_events(session_token, [ "download_task_done" ]) as ws:
+        for i, resp in enumerate(await asyncio.gather(*(
+                api_request_async("post", "/downloads/add", session_token, data=request)
+                for request in requests_list))):
+            if resp and resp != "forbidden":
+                state['task_ids'][i] = resp['id']
+        task_ids = [ task_id for task_id in state['task_ids'] if task_id is not None ]
+        if not task_ids:
+            return [ None ] * len(requests_list)
+
+        done = None
+        if ws:
+            done = asyncio.Event()
+            watcher = asyncio.create_task(watch_events(ws, "download",
+                                                       lambda result: result.get("id") in task_ids,
+                                                       done))
+        try:
+            tasks = await follow_downloads(session_token, task_ids, done)
+        finally:
+            if ws:
+                watcher.cancel()
+                with suppress(asyncio.CancelledError):
+                    await watcher
+        return [ tasks.get(task_id) for task_id in state['task_ids'] ]
+
+async def follow_downloads(session_token, task_ids, done):
+    """Display the progress of download tasks until they are neither
+    downloading nor checking their hash, and return their last state.
+
+    A single task is read with GET /downloads/{id}, several tasks with one
+    GET /downloads/ per tick. `done` is an asyncio.Event set when the
+    Freebox notifies the end of a task, or None to poll with a growing delay.
+    Failed reads are retried for DOWNLOAD_LOST_TIMEOUT seconds, or until
+    the circuit breaker opens.
+
+    Returns
+    -------
+    dict[int, dict]
+        Last state of each task by id; tasks that could not be read are
+        missing, tasks erased meanwhile have the status 'missing'.
+    """
+    from tqdm import tqdm
+
+    bars = { }
+    checking = set()
+    tasks = { }
+    pending = set(task_ids)
+    delay = DOWNLOAD_POLL_MIN
+    lost = None
+
+    def label(task):
+        return f"{task['name']} : " if len(task_ids) > 1 else ""
+
+    try:
+        while pending:
+            if len(task_ids) == 1:
+                task = await api_request_async("get", f"/downloads/{task_ids[0]}", session_token)
+                listing = [ task ] if task and task != "forbidden" else None
+            else:
+                listing = await api_request_async("get", "/downloads/", session_token)
+            if not listing or listing == "forbidden":
+                lost = lost or time.monotonic()
+                if breaker_remaining() or time.monotonic() - lost > DOWNLOAD_LOST_TIMEOUT:
+                    tqdm.write("Freebox injoignable, abandon du suivi des téléchargements")
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, DOWNLOAD_POLL_MAX)
+                continue
+            lost = None
+
+            for task in listing:
+                task_id = task['id']
+                if task_id not in pending:
+                    continue
+                tasks[task_id] = task
+
+                if task['size'] and task_id not in checking:
+                    if task_id not in bars:
+                        bars[task_id] = tqdm(total=task['size'],unit_scale=True,unit='o',
+                                             position=task_ids.index(task_id),
+                                             desc=task['name'] if len(task_ids) > 1 else None)
+                    bars[task_id].update(task['rx_bytes'] - bars[task_id].n)
+
+                if task['status'] == 'checking' and task_id not in checking:
+                    checking.add(task_id)
+                    if task_id in bars and len(task_ids) == 1:
+                        bars[task_id].close()
+                    tqdm.write(f"{label(task)}Vérification du SHA")
+                elif task['status'] not in DOWNLOAD_ACTIVE:
+                    pending.discard(task_id)
+                    if task_id in bars:
+                        bars[task_id].close()
+                    tqdm.write(f"{label(task)}{task['status']}")
+
+            # tasks erased meanwhile, from the Freebox interface or another client
+            for task_id in pending - { task['id'] for task in listing }:
+                pending.discard(task_id)
+                if task_id in bars:
+                    bars[task_id].close()
+                task = tasks.get(task_id)
+                tqdm.write(f"{label(task) if task else ''}Tâche {task_id} disparue")
+                tasks[task_id] = dict(task or { 'id': task_id }, status='missing')
+
+            if not pending:
                 break
-            time.sleep(0.5)
-        print(task['status'])
-    except KeyboardInterrupt:
-        t.close()
-        # On Ctrl-C remove the task and the file
-        task = api_request("delete", f"/downloads/{task_id}/erase", session_token)
-        print("Interrompu... fichier effacé")
-        return None
-    # On success remove the task but keep the file
-    if task['status'] != 'done':
-        print("Erreur de téléchargement... fichier effacé")
-        task = api_request("delete", f"/downloads/{task_id}/erase", session_token)
-        return None
-    else:
-        destdir = base64.b64decode(task['download_dir']).decode('utf-8')
-        filepath = os.path.join(destdir, task['name'])
-        task = api_request("delete", f"/downloads/{task_id}", session_token)
-        return filepath
+            if done is not None:
+                try:
+                    await asyncio.wait_for(done.wait(), DOWNLOAD_PROGRESS_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                done.clear()
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 1.5, DOWNLOAD_POLL_MAX)
+    finally:
+        for bar in bars.values():
+            bar.close()
+    return tasks
 
 def install(session_token, args):
     download_dir = search_VMs(session_token, "/")
+    if not download_dir:
+        print("Dossier VMs introuvable sur la Freebox")
+        return
     download_dir_b64 = base64.b64encode(download_dir.encode("utf-8")).decode("ascii")
 
     vm = { }
@@ -678,14 +2655,9 @@ def install(session_token, args):
     location = None
     if args.install:
         if args.cloud_init:
-            distro_list = get_list_distro(session_token)
-            distro = next((item for item in distro_list if item['short-id'] == args.install), None)
-            if not distro:
-                distro_list = get_list_extra_distro()
-                distro = next((item for item in distro_list if item['short-id'] == args.install), None)
+            distro = find_distro(session_token, args.install)
         else:
-            distro_list = get_list_iso()
-            distro = next((item for item in distro_list if item['short-id'] == args.install), None)
+            distro = find_distro(session_token, args.install, iso=True)
 
         if not distro:
             print(f"Distribution inconnue : {args.install}")
@@ -737,6 +2709,9 @@ def install(session_token, args):
         disk_path_b64 = base64.b64encode(disk_path.encode("utf-8")).decode("ascii")
 
         info = api_request("post", f"/vm/disk/info", session_token, json={ 'disk_path': disk_path_b64 })
+        if info == "forbidden":
+            print(f"Impossible de lire les informations du disque {disk_path}")
+            return
         if not info:
             if not args.disk_size:
                 print(f"Le disque {disk_path} n'existe pas, et la taille n'a pas été spécifiée pour sa création")
@@ -748,21 +2723,31 @@ def install(session_token, args):
             else:
                 print(f"Le type du fichier {disk_path} n'a pas pu être déterminé.")
                 return
-            asyncio.run(disk_execute(session_token, disk_create, {
+            if not asyncio.run(disk_execute(session_token, disk_create, {
                 'path_b64': disk_path_b64,
                 'size': disk_size,
                 'type': disk_type
-            }))
+            })):
+                print(f"Échec de la création du disque {disk_path}")
+                return
             info = api_request("post", f"/vm/disk/info", session_token, json={ 'disk_path': disk_path_b64 })
+            if not info or info == "forbidden":
+                print(f"Impossible de lire les informations du disque {disk_path}")
+                return
             print(f"Disque créé à {disk_path} de taille {info['virtual_size']}, type {disk_type}")
 
         if info['virtual_size'] < disk_size:
-            asyncio.run(disk_execute(session_token, disk_resize, {
+            if not asyncio.run(disk_execute(session_token, disk_resize, {
                 'path_b64': disk_path_b64,
                 'size': disk_size,
                 'shrink_allow': False
-            }))
+            })):
+                print(f"Échec du redimensionnement du disque {disk_path}")
+                return
             info = api_request("post", f"/vm/disk/info", session_token, json={ 'disk_path': disk_path_b64 })
+            if not info or info == "forbidden":
+                print(f"Impossible de lire les informations du disque {disk_path}")
+                return
             print(f"Disque redimensionné à {info['virtual_size']}")
 
         vm['disk_path'] = disk_path_b64
@@ -777,7 +2762,8 @@ def install(session_token, args):
     vm['enable_screen'] = args.enable_screen;
 
     res = api_request("post", "/vm/", session_token, json = vm )
-    if not res:
+    if not res or res == "forbidden":
+        print("Échec de la création de la VM")
         return
 
     vm_id = res['id']
@@ -819,51 +2805,185 @@ def console(session_token, args):
 
     vm_id, vm_name = vm["id"], vm["name"]
 
+    async def link():
+        # Attach to a console server when one runs for this VM
+        address = args.attach or console_socket_path(vm_id)
+        server = await open_console_socket(address)
+        if server and await console_attach(session_token, vm_id, *server, args.read_only):
+            return
+        if args.attach or args.read_only:
+            print(f"Aucun serveur de console sur {address}\r", file=sys.stderr)
+            return
+        await console_link(session_token, vm_id)
+
     print(f"Connexion à la console de '{vm_name}' (VM #{vm_id}), Ctrl-B D pour sortir...",
           file=sys.stderr)
 
     with raw_terminal():
         try:
-            asyncio.run(console_link(session_token, vm_id))
+            asyncio.run(link())
         except KeyboardInterrupt:
             pass
 
-async def vnc_proxy_once(session_token, vm_id, reader, writer, prefer_base64=False):
-    """
-    Bridge one TCP client <-> Freebox VNC-over-WebSocket connection.
-    """
-    url = f"wss://mafreebox.freebox.fr/api/v8/vm/{vm_id}/vnc"
+def console_server(session_token, args):
+    vm = select_vm(session_token, args.vm)
+    if not vm:
+        print("VM non trouvée. Utilisez 'freeboxvm list' pour voir la liste.", file=sys.stderr)
+        sys.exit(1)
 
-    # TLS verification disabled (Freebox local cert); change if you pinned certs.
-    ssl_ctx = ssl.create_default_context()
-    ssl_ctx.check_hostname = False
-    ssl_ctx.verify_mode = ssl.CERT_NONE
+    if args.port:
+        asyncio.run(run_console_server(session_token, vm["id"], host=args.listen, port=args.port,
+                                       metrics=args.metrics))
+    else:
+        asyncio.run(run_console_server(session_token, vm["id"],
+                                       path=args.socket or console_socket_path(vm["id"]),
+                                       metrics=args.metrics))
 
+async def vnc_connect(session_token, vm_id, prefer_base64=False):
+    """
+    Open the Freebox VNC-over-WebSocket connection of a VM.
+    """
     # Try to negotiate 'binary' first; some QEMU endpoints accept 'base64' only.
     subprotocols = ['binary', 'base64'] if not prefer_base64 else ['base64', 'binary']
 
-    async with connect(
-        url,
-        additional_headers={"X-Fbx-App-Auth": session_token},
+    start = time.monotonic()
+    ws = await ws_connect(
+        session_token, f"/vm/{vm_id}/vnc",
         subprotocols=subprotocols,
-        ssl=ssl_ctx,
         open_timeout=10,
         close_timeout=5,
         max_size=None,  # do not cap frame size
-    ) as ws:
+        compression=None,  # VNC encodings are already compressed
+    )
+    _vnc_stats["handshakes"] += 1
+    _vnc_stats["handshake_time"] += time.monotonic() - start
+    return ws
+
+def vnc_pool_create(session_token, vm_id, size, max_idle):
+    """Create a pool of `size` open VNC websockets for a VM, each kept at
+    most `max_idle` seconds. The pool is filled by `vnc_pool_maintain`."""
+    return { "session_token": session_token, "vm_id": vm_id, "size": size,
+             "max_idle": max_idle, "idle": [ ], "filling": None }
+
+async def vnc_pool_take(pool):
+    """Return a healthy pooled websocket, or None if the pool is empty.
+
+    Websockets that are closed, older than the pool max idle time or that
+    do not answer a ping are discarded. The pool is refilled in the
+    background.
+    """
+    from websockets.exceptions import WebSocketException
+    from websockets.protocol import State
+
+    ws = None
+    while pool["idle"] and ws is None:
+        ws, opened = pool["idle"].pop(0)
+        healthy = ws.state == State.OPEN and time.monotonic() - opened <= pool["max_idle"]
+        if healthy:
+            try:
+                await asyncio.wait_for(await ws.ping(), 1)
+            except (asyncio.TimeoutError, WebSocketException):
+                healthy = False
+        if not healthy:
+            await ws.close()
+            ws = None
+    vnc_pool_refill(pool)
+    if ws is not None:
+        _vnc_stats["pooled"] += 1
+        metric_add("freeboxvm_vnc_pooled_total", vm=pool["vm_id"])
+    return ws
+
+def vnc_pool_refill(pool):
+    """Start filling the pool, unless it is already being filled."""
+    async def fill():
+        from websockets.exceptions import WebSocketException
+
+        while len(pool["idle"]) < pool["size"]:
+            try:
+                ws = await vnc_connect(pool["session_token"], pool["vm_id"])
+            except (OSError, asyncio.TimeoutError, WebSocketException):
+                break
+            pool["idle"].append((ws, time.monotonic()))
+
+    if pool["filling"] is None or pool["filling"].done():
+        pool["filling"] = asyncio.create_task(fill())
+
+async def vnc_pool_maintain(pool):
+    """Keep the pool filled and renew expired websockets, until cancelled."""
+    from websockets.protocol import State
+
+    try:
+        while True:
+            now = time.monotonic()
+            for ws, opened in [ item for item in pool["idle"]
+                                if now - item[1] > pool["max_idle"] or item[0].state != State.OPEN ]:
+                pool["idle"].remove((ws, opened))
+                await ws.close()
+            vnc_pool_refill(pool)
+            await asyncio.sleep(pool["max_idle"] / 2)
+    finally:
+        if pool["filling"] is not None:
+            pool["filling"].cancel()
+        for ws, opened in pool["idle"]:
+            await ws.close()
+        pool["idle"].clear()
+
+def print_vnc_stats():
+    """Print how many VNC clients were served from a pre-warmed websocket."""
+    if not _vnc_stats["pooled"] or not _vnc_stats["handshakes"]:
+        return
+    handshake = _vnc_stats["handshake_time"] / _vnc_stats["handshakes"]
+    print(f"Connexions VNC pré-établies utilisées : {_vnc_stats['pooled']}, "
+          f"négociation moyenne {handshake * 1000:.0f} ms, "
+          f"temps gagné estimé {_vnc_stats['pooled'] * handshake:.1f} s")
+
+async def vnc_proxy_once(session_token, vm_id, reader, writer, prefer_base64=False, pool=None):
+    """
+    Bridge one TCP client <-> Freebox VNC-over-WebSocket connection.
+
+    The websocket is taken from `pool` when possible (see `vnc_pool_create`).
+    """
+    start = time.perf_counter()
+    counters = ws_counters()
+    ws = await vnc_pool_take(pool) if pool else None
+    if ws is None:
+        ws = await vnc_connect(session_token, vm_id, prefer_base64)
+    metric_add("freeboxvm_clients", 1, service="vnc", vm=vm_id)
+    try:
+        with metrics_session("vnc", vm_id, counters):
+            await vnc_bridge(ws, reader, writer, counters)
+    finally:
+        metric_add("freeboxvm_clients", -1, service="vnc", vm=vm_id)
+        trace_ws(f"/vm/{vm_id}/vnc", start, counters, ws)
+
+async def vnc_bridge(ws, reader, writer, counters):
+    """Copy data between the VNC websocket `ws` and a TCP client until
+    either side closes, counting the frames and waits in `counters`."""
+    from websockets.exceptions import ConnectionClosed
+
+    async with ws:
         mode = ws.subprotocol or 'binary'
         use_base64 = (mode == 'base64')
 
+        # Let the transport buffer several frames and only wait for the
+        # client when the buffer goes over the high watermark.
+        transport = writer.transport
+        transport.set_write_buffer_limits(high=VNC_WRITE_HIGH, low=VNC_WRITE_LOW)
+        read_size = _vnc_transport["read_size"]
+
         async def ws_to_tcp():
             try:
-                async for msg in ws:
-                    if isinstance(msg, str):
-                        # text frames: either base64 data or shouldn't happen
-                        data = base64.b64decode(msg) if use_base64 else msg.encode()
-                    else:
-                        data = msg
-                    writer.write(data)
-                    await writer.drain()
+                while True:
+                    # Frames are received undecoded: text frames hold ASCII
+                    # base64 data, binascii works on bytes without a str copy.
+                    msg = await ws.recv(decode=False)
+                    counters["frames_in"] += 1
+                    counters["bytes_in"] += len(msg)
+                    writer.write(binascii.a2b_base64(msg) if use_base64 else msg)
+                    if transport.get_write_buffer_size() > VNC_WRITE_HIGH:
+                        start = time.perf_counter()
+                        await writer.drain()
+                        counters["drain_in"] += time.perf_counter() - start
             except ConnectionClosed:
                 pass
             finally:
@@ -876,13 +2996,20 @@ async def vnc_proxy_once(session_token, vm_id, reader, writer, prefer_base64=Fal
         async def tcp_to_ws():
             try:
                 while True:
-                    data = await reader.read(65536)
+                    # read() returns everything buffered up to read_size:
+                    # input received meanwhile goes in a single frame.
+                    data = await reader.read(read_size)
                     if not data:
                         break
+                    counters["frames_out"] += 1
+                    counters["bytes_out"] += len(data)
+                    # send() only waits when the websocket is saturated
+                    start = time.perf_counter()
                     if use_base64:
-                        await ws.send(base64.b64encode(data).decode('ascii'))
+                        await ws.send(binascii.b2a_base64(data, newline=False), text=True)
                     else:
                         await ws.send(data)
+                    counters["drain_out"] += time.perf_counter() - start
             finally:
                 try:
                     await ws.close()
@@ -892,10 +3019,14 @@ async def vnc_proxy_once(session_token, vm_id, reader, writer, prefer_base64=Fal
         await asyncio.gather(ws_to_tcp(), tcp_to_ws())
 
 
-async def run_vnc_proxy(session_token, vm_id, host="127.0.0.1", port=5901):
-    """
-    Start TCP server that forwards to Freebox VNC WS for the given VM.
-    """
+def ws_preload():
+    """Import the websocket stack now: servers would otherwise pay for it
+    when their first client connects (see `lazy_import`)."""
+    import ssl
+    import websockets.asyncio.client
+
+def stop_on_signals():
+    """Return a future completed on SIGINT or SIGTERM."""
     loop = asyncio.get_running_loop()
     stop = loop.create_future()
 
@@ -906,13 +3037,18 @@ async def run_vnc_proxy(session_token, vm_id, host="127.0.0.1", port=5901):
     # Graceful Ctrl-C
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, _handle_sig)
+    return stop
 
+def vnc_client_handler(session_token, vm_id, pool=None):
+    """Return an asyncio.start_server() callback bridging each TCP client to
+    the VNC of a VM, using pre-warmed websockets from `pool` if given."""
     async def handler(reader, writer):
         peer = writer.get_extra_info("peername")
         print(f"Client connecté depuis {peer}")
         try:
-            await vnc_proxy_once(session_token, vm_id, reader, writer)
+            await vnc_proxy_once(session_token, vm_id, reader, writer, pool=pool)
         except Exception as e:
+            metric_add("freeboxvm_tunnel_errors_total", service="vnc", vm=vm_id)
             print(f"Erreur de tunnel : {e}")
             try:
                 writer.close()
@@ -922,18 +3058,127 @@ async def run_vnc_proxy(session_token, vm_id, host="127.0.0.1", port=5901):
         finally:
             print(f"Client déconnecté de {peer}")
 
-    server = await asyncio.start_server(handler, host, port)
-    sockets = ", ".join(str(s.getsockname()) for s in server.sockets or [])
-    async with server:
-        await stop
+    return handler
+
+async def run_vnc_proxy(session_token, vm_id, host="127.0.0.1", port=5901,
+                        prewarm=0, max_idle=VNC_POOL_MAX_IDLE, metrics=None):
+    """
+    Start TCP server that forwards to Freebox VNC WS for the given VM.
+
+    With `prewarm`, that many websockets are kept open in advance to serve
+    new clients without waiting for a handshake. With `metrics`, a
+    (host, port) tuple, the metrics are served there (see `metrics_serve`).
+    """
+    ws_preload()
+    stop = stop_on_signals()
+    metrics_server = await metrics_serve(metrics) if metrics else None
+
+    pool = vnc_pool_create(session_token, vm_id, prewarm, max_idle) if prewarm else None
+    maintainer = asyncio.create_task(vnc_pool_maintain(pool)) if pool else None
+
+    server = await asyncio.start_server(vnc_client_handler(session_token, vm_id, pool), host, port)
+    try:
+        async with server:
+            await stop
+    finally:
+        if metrics_server:
+            metrics_server.close()
+        if maintainer:
+            maintainer.cancel()
+            await asyncio.gather(maintainer, return_exceptions=True)
+    print("Arrêt du proxy VNC...")
+    print_vnc_stats()
+
+async def run_vnc_multi_proxy(session_token, host, port_map, port_range,
+                              prewarm=0, max_idle=VNC_POOL_MAX_IDLE, metrics=None):
+    """
+    Serve the VNC of several VMs from one process, one TCP port per VM.
+
+    A VM is served while it is running with its screen enabled, on the port
+    given by `port_map` ({port: VM ID or name}), or else on port
+    `port_range[0] + VM ID` if it is not above `port_range[1]`. Listening
+    ports follow the VMs being started and stopped (vm_state_changed
+    events, and a refresh every VNC_MAP_REFRESH seconds). With `prewarm`,
+    each served VM gets its own pool of pre-warmed websockets. With
+    `metrics`, the metrics of all the VMs are served there.
+    """
+    ws_preload()
+    stop = stop_on_signals()
+    servers = { }
+    metrics_server = await metrics_serve(metrics) if metrics else None
+
+    def vm_port(vm):
+        for port, selector in port_map.items():
+            if selector == vm['name'] or selector == str(vm['id']):
+                return port
+        if port_range and port_range[0] + vm['id'] <= port_range[1]:
+            return port_range[0] + vm['id']
+        return None
+
+    async def sync():
+        vm_list = await api_request_async("get", "/vm/", session_token, empty=[ ])
+        if vm_list is None or vm_list == "forbidden":
+            return
+        served = { vm['id']: vm for vm in vm_list
+                   if vm.get('status') == 'running' and vm.get('enable_screen') }
+        for vm_id in [ vm_id for vm_id in servers if vm_id not in served ]:
+            server, port, maintainer = servers.pop(vm_id)
+            server.close()
+            if maintainer:
+                maintainer.cancel()
+            print(f"Fin du proxy VNC de la VM #{vm_id} sur {host}:{port}")
+        for vm_id, vm in served.items():
+            port = vm_port(vm)
+            if vm_id in servers or port is None:
+                continue
+            pool = vnc_pool_create(session_token, vm_id, prewarm, max_idle) if prewarm else None
+            try:
+                server = await asyncio.start_server(vnc_client_handler(session_token, vm_id, pool),
+                                                    host, port)
+            except OSError as e:
+                print(f"Proxy VNC pour '{vm['name']}' (VM #{vm_id}) impossible sur {host}:{port} : {e}")
+                continue
+            maintainer = asyncio.create_task(vnc_pool_maintain(pool)) if pool else None
+            servers[vm_id] = (server, port, maintainer)
+            print(f"Proxy VNC pour '{vm['name']}' (VM #{vm_id}) sur {host}:{port}")
+
+    async with subscribe_events(session_token, [ "vm_state_changed" ]) as ws:
+        changed = asyncio.Event()
+        if ws:
+            watcher = asyncio.create_task(watch_events(ws, "vm", lambda result: True, changed))
+        try:
+            while not stop.done():
+                changed.clear()
+                await sync()
+                waiter = asyncio.ensure_future(changed.wait())
+                await asyncio.wait([ stop, waiter ], timeout=VNC_MAP_REFRESH,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+        finally:
+            if ws:
+                watcher.cancel()
+                with suppress(asyncio.CancelledError):
+                    await watcher
+            if metrics_server:
+                metrics_server.close()
+            for server, port, maintainer in servers.values():
+                server.close()
+                if maintainer:
+                    maintainer.cancel()
+            await asyncio.gather(*(maintainer for server, port, maintainer in servers.values()
+                                   if maintainer), return_exceptions=True)
     print("Arrêt du proxy VNC...")
+    print_vnc_stats()
 
-async def run_vnc_and_console(session_token, vm_id, host, port):
+async def run_vnc_and_console(session_token, vm_id, host, port,
+                              prewarm=0, max_idle=VNC_POOL_MAX_IDLE, metrics=None):
     """
     Run the VNC proxy and the interactive console concurrently.
     The console ends on Ctrl-B D (your existing behavior); we then stop the proxy.
+    `prewarm`, `max_idle` and `metrics` are passed to `run_vnc_proxy`.
     """
-    proxy_task = asyncio.create_task(run_vnc_proxy(session_token, vm_id, host, port))
+    proxy_task = asyncio.create_task(run_vnc_proxy(session_token, vm_id, host, port,
+                                                   prewarm, max_idle, metrics))
 
     async def _console_task():
         with raw_terminal():
@@ -954,6 +3199,20 @@ async def run_vnc_and_console(session_token, vm_id, host, port):
 
 
 def vnc_proxy(session_token, args):
+    _vnc_transport["read_size"] = args.read_size * 1024
+    if args.port_range or args.port_map:
+        if args.vm or args.console:
+            print("--port-range et --port-map remplacent la sélection d'une VM et --console",
+                  file=sys.stderr)
+            sys.exit(1)
+        asyncio.run(run_vnc_multi_proxy(session_token, args.listen, dict(args.port_map),
+                                        args.port_range, args.prewarm, args.max_idle,
+                                        args.metrics))
+        return
+
+    if not args.vm:
+        print("Indiquez une VM, --port-range ou --port-map", file=sys.stderr)
+        sys.exit(1)
     vm = select_vm(session_token, args.vm)
     if not vm:
         print("VM non trouvée. Utilisez 'freeboxvm list' pour voir la liste.", file=sys.stderr)
@@ -962,24 +3221,27 @@ def vnc_proxy(session_token, args):
     print(f"Proxy VNC pour '{vm_name}' (VM #{vm_id}) sur {args.listen}:{args.port}")
 
     if args.console:
-        asyncio.run(run_vnc_and_console(session_token, vm_id, args.listen, args.port))
+        asyncio.run(run_vnc_and_console(session_token, vm_id, args.listen, args.port,
+                                        args.prewarm, args.max_idle, args.metrics))
     else:
-        asyncio.run(run_vnc_proxy(session_token, vm_id, args.listen, args.port))
+        asyncio.run(run_vnc_proxy(session_token, vm_id, args.listen, args.port,
+                                  args.prewarm, args.max_idle, args.metrics))
 
 def poweron(session_token, args):
 
-    vm = select_vm(session_token, args.vm)
-    if not vm:
-        print("VM non trouvée. Utilisez 'freeboxvm list' pour voir la liste.", file=sys.stderr)
+    vms = select_vms(session_token, args)
+    if (args.console or args.vnc_proxy) and len(vms) > 1:
+        print("--console et --vnc-proxy ne sont possibles qu'avec une seule VM", file=sys.stderr)
         sys.exit(1)
 
-    vm_id, vm_name = vm["id"], vm["name"]
-
-    print(f"Démarrage de '{vm_name}' (VM #{vm_id})",
-          file=sys.stderr)
+    for vm in vms:
+        print(f"Démarrage de '{vm['name']}' (VM #{vm['id']})",
+              file=sys.stderr)
 
-    api_request("post", f"/vm/{vm_id}/start", session_token)
+    report_batch(run_batch(vms, lambda vm: vm_power(session_token, vm, "start", 'running', args),
+                           args.jobs))
 
+    vm_id = vms[0]["id"]
     if args.console and args.vnc_proxy:
         asyncio.run(run_vnc_and_console(session_token, vm_id, args.listen, args.port))
     elif args.console:
@@ -992,34 +3254,26 @@ def poweron(session_token, args):
         asyncio.run(run_vnc_proxy(session_token, vm_id, args.listen, args.port))
 
 def poweroff(session_token, args):
-    vm = select_vm(session_token, args.vm)
-    if not vm:
-        print("VM non trouvée. Utilisez 'freeboxvm list' pour voir la liste.", file=sys.stderr)
-        sys.exit(1)
+    vms = select_vms(session_token, args)
 
-    vm_id, vm_name = vm["id"], vm["name"]
-
-    print(f"Extinction de '{vm_name}' (VM #{vm_id})",
-          file=sys.stderr)
+    for vm in vms:
+        print(f"Extinction de '{vm['name']}' (VM #{vm['id']})",
+              file=sys.stderr)
 
-    if args.force:
-        api_request("post", f"/vm/{vm_id}/stop", session_token)
-    else:
-        api_request("post", f"/vm/{vm_id}/powerbutton", session_token)
+    action = "stop" if args.force else "powerbutton"
+    report_batch(run_batch(vms, lambda vm: vm_power(session_token, vm, action, 'stopped', args),
+                           args.jobs))
 
 def reset(session_token, args):
 
-    vm = select_vm(session_token, args.vm)
-    if not vm:
-        print("VM non trouvée. Utilisez 'freeboxvm list' pour voir la liste.", file=sys.stderr)
-        sys.exit(1)
+    vms = select_vms(session_token, args)
 
-    vm_id, vm_name = vm["id"], vm["name"]
-
-    print(f"Redémarrage de '{vm_name}' (VM #{vm_id})",
-          file=sys.stderr)
+    for vm in vms:
+        print(f"Redémarrage de '{vm['name']}' (VM #{vm['id']})",
+              file=sys.stderr)
 
-    api_request("post", f"/vm/{vm_id}/restart", session_token)
+    report_batch(run_batch(vms, lambda vm: vm_power(session_token, vm, "restart", 'running', args),
+                           args.jobs))
 
 def download(session_token, args):
     if not args.short_id and not args.url:
@@ -1036,38 +3290,35 @@ def download(session_token, args):
     else:
         filename = None
 
-    if args.short_id:
-        short_id = args.short_id
-        if args.iso:
-            distro_list = get_list_iso()
-            entry = next((item for item in distro_list if item['short-id'] == short_id), None)
-        else:
-            distro_list = get_list_distro(session_token)
-            entry = next((item for item in distro_list if item['short-id'] == short_id), None)
-            if not entry:
-                distro_list = get_list_extra_distro()
-                entry = next((item for item in distro_list if item['short-id'] == short_id), None)
-        if entry:
-            request = {
-               'download_url': entry['url'],
-               'download_dir': download_dir_b64,
-               'filename': filename,
-                'hash': entry.get('hash')
-            }
-        else:
+    requests_list = [ ]
+    for short_id in args.short_id:
+        entry = find_distro(session_token, short_id, iso=args.iso)
+        if not entry:
             print(f"short-id {short_id} introuvable")
             return
-    else:
-            request = {
-               'download_url': args.url,
-               'download_dir': download_dir_b64,
-               'filename': filename,
-                'hash': args.hash
-            }
+        requests_list.append({
+           'download_url': entry['url'],
+           'download_dir': download_dir_b64,
+           'filename': filename,
+           'hash': entry.get('hash')
+        })
+
+    hashes = args.hash or [ ]
+    for i, url in enumerate(args.url or [ ]):
+        requests_list.append({
+           'download_url': url,
+           'download_dir': download_dir_b64,
+           'filename': filename,
+           'hash': hashes[i] if i < len(hashes) else None
+        })
+
+    if filename and len(requests_list) > 1:
+        print("--filename ne peut être utilisé qu'avec un seul téléchargement")
+        return
 
-    filepath = get_file(session_token, request, args.background)
-    if filepath:
-        print(f"{filepath} a été téléchargé")
+    for filepath in get_files(session_token, requests_list, args.background):
+        if filepath:
+            print(f"{filepath} a été téléchargé")
 
 def disk_create(session_token, args):
     task_id = api_request("post", '/vm/disk/create', session_token, json={
@@ -1086,34 +3337,41 @@ def disk_resize(session_token, args):
     return task_id
 
 async def disk_execute(session_token, action, args):
-    ssl_ctx = ssl.create_default_context()
-    ssl_ctx.check_hostname = False
-    ssl_ctx.verify_mode = ssl.CERT_NONE
-
-    async with connect("wss://mafreebox.freebox.fr/api/v8/ws/event/",
-                       additional_headers={"X-Fbx-App-Auth": session_token},
-                       ssl=ssl_ctx) as ws:
-        await ws.send(json.dumps({
-            "action": "register",
-            "events": [ "vm_disk_task_done"],
-        }))
-        task_id = action(session_token, args)
-        if not task_id:
-            return False
-        async for msg in ws:
-            try:
-                data = json.loads(msg)
-            except Exception:
-                continue
-            if data.get("action") == "register":
-                if not data.get("success"):
-                    return False
-                continue
-            if data.get("action") == "notification" and data.get("source") == "vm" and data.get("event") == "disk_task_done":
-                result = data.get("result", {})
-                if result.get("id") == task_id["id"]:
-                    break
-    api_request("delete", f"/vm/disk/task/{task_id['id']}", session_token)
+    start = time.perf_counter()
+    counters = ws_counters()
+    ws = await ws_connect(session_token, "/ws/event/")
+    try:
+        async with ws:
+            register = json.dumps({
+                "action": "register",
+                "events": [ "vm_disk_task_done"],
+            })
+            counters["frames_out"] += 1
+            counters["bytes_out"] += len(register)
+            await ws.send(register)
+            loop = asyncio.get_running_loop()
+            task_id = await loop.run_in_executor(api_executor(), action, session_token, args)
+            if not task_id or task_id == "forbidden":
+                return False
+            async for msg in ws:
+                counters["frames_in"] += 1
+                counters["bytes_in"] += len(msg)
+                try:
+                    data = json.loads(msg)
+                except Exception:
+                    continue
+                if data.get("action") == "register":
+                    if not data.get("success"):
+                        return False
+                    continue
+                if data.get("action") == "notification" and data.get("source") == "vm" and data.get("event") == "disk_task_done":
+                    result = data.get("result", {})
+                    if result.get("id") == task_id["id"]:
+                        break
+    finally:
+        trace_ws("/ws/event/", start, counters, ws)
+    await api_request_async("delete", f"/vm/disk/task/{task_id['id']}", session_token)
+    return True
 
 def disk(session_token, args):
 
@@ -1124,17 +3382,19 @@ def disk(session_token, args):
         disk_size = human_size(args.size)
 
     if args.action == 'create':
-        asyncio.run(disk_execute(session_token, disk_create, {
+        if not asyncio.run(disk_execute(session_token, disk_create, {
             'path_b64': disk_path_b64,
             'size': disk_size,
             'type': args.type
-        }))
+        })):
+            print("Échec de la création du disque")
     elif args.action == 'resize':
-        asyncio.run(disk_execute(session_token, disk_resize, {
+        if not asyncio.run(disk_execute(session_token, disk_resize, {
             'path_b64': disk_path_b64,
             'size': disk_size,
             'shrink_allow': args.shrink_allow
-        }))
+        })):
+            print("Échec du redimensionnement du disque")
     elif args.action == 'delete':
         info = api_request("post", f"/vm/disk/info", session_token, json={ 'disk_path': disk_path_b64 })
         if not info:
@@ -1142,8 +3402,10 @@ def disk(session_token, args):
         rm = api_request("post", "/fs/rm/", session_token, json={ 'files': [ disk_path_b64 ] })
     elif args.action == 'info':
         info = api_request("post", f"/vm/disk/info", session_token, json={ 'disk_path': disk_path_b64 })
-        if not info:
+        if not info or info == "forbidden":
+            print("Impossible de lire les informations du disque")
             return
+        import humanize
         print(f"Fichier : {args.path}")
         print(f"Taille virtuelle : {humanize.naturalsize(info['virtual_size'], binary=True)} Espace occupé : {humanize.naturalsize(info['actual_size'], binary=True)} type : {info['type']}")
 
@@ -1155,9 +3417,89 @@ def parse_args():
                    version=f"%(prog)s {__version__}")
     p.add_argument("--token-file", default=DEFAULT_TOKEN_FILE,
                    help="Chemin du fichier token (défaut: %(default)s)")
+    p.add_argument("--pool-size", metavar="N", type=int, default=HTTP_POOL_SIZE,
+                   help="Nombre de connexions HTTP gardées ouvertes (défaut: %(default)s)")
+
+    def endpoint_timeout(value):
+        endpoint, _, seconds = value.rpartition("=")
+        try:
+            return endpoint, float(seconds)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"délai invalide : {value}")
+
+    def metrics_address(value):
+        host, _, port = value.rpartition(":")
+        if not port.isdigit():
+            raise argparse.ArgumentTypeError(f"adresse invalide : {value}")
+        return host or "127.0.0.1", int(port)
+
+    def rate_limit(value):
+        rate, _, burst = value.partition(":")
+        try:
+            rate, burst = float(rate), int(burst or API_RATE_BURST)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"limite invalide : {value}")
+        if rate < 0 or burst < 1:
+            raise argparse.ArgumentTypeError(f"limite invalide : {value}")
+        return rate, burst
+
+    def circuit_breaker(value):
+        failures, _, cooldown = value.partition(":")
+        try:
+            failures, cooldown = int(failures), float(cooldown or API_BREAKER_COOLDOWN)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"seuil invalide : {value}")
+        if failures < 0 or cooldown < 0:
+            raise argparse.ArgumentTypeError(f"seuil invalide : {value}")
+        return failures, cooldown
+
+    p.add_argument("--timeout", metavar="[ENDPOINT=]SECONDES", type=endpoint_timeout,
+                   action="append", default=[],
+                   help="Délai des appels API, éventuellement pour un préfixe d'endpoint (répétable)")
+    p.add_argument("--retries", metavar="N", type=int, default=API_RETRIES,
+                   help="Nouvelles tentatives d'un appel API après une erreur passagère, "
+                        "avec un délai croissant (défaut: %(default)s)")
+    p.add_argument("--rate-limit", metavar="REQ[:RAFALE]", type=rate_limit,
+                   help=f"Limiter les appels API à REQ par seconde, par rafales d'au plus "
+                        f"RAFALE (défaut: pas de limite, rafales de {API_RATE_BURST})")
+    p.add_argument("--circuit-breaker", metavar="ÉCHECS[:SECONDES]", type=circuit_breaker,
+                   help=f"Après ÉCHECS erreurs passagères consécutives, faire échouer les appels "
+                        f"API pendant SECONDES, 0 pour jamais "
+                        f"(défaut: {API_BREAKER_FAILURES}:{API_BREAKER_COOLDOWN:g})")
+    p.add_argument("--no-cache", action="store_true",
+                   help="Ignorer les données en cache (liste des VM, dossier VMs, catalogue libosinfo...)")
+    p.add_argument("--http-stats", action="store_true",
+                   help="Afficher le nombre de connexions HTTP ouvertes et de requêtes effectuées")
+    p.add_argument("--no-agent", action="store_true",
+                   help="Appeler directement la Freebox même si un agent freeboxvm tourne")
+    p.add_argument("--api-url", metavar="URL", default=os.environ.get(API_URL_ENV),
+                   help=f"URL de base de l'API (défaut: ${API_URL_ENV} ou {API_URL})")
+    p.add_argument("--trace", metavar="FICHIER",
+                   help="Enregistrer les appels API et websockets dans ce fichier, "
+                        "et en afficher le résumé à la fin")
+    p.add_argument("--trace-format", choices=TRACE_FORMATS, default="jsonl",
+                   help="Format de la trace : lignes JSON ou trace Chrome/Perfetto (défaut: %(default)s)")
 
     sub = p.add_subparsers(dest="cmd", required=True)
 
+    def add_batch_arguments(parser):
+        parser.add_argument("vm", nargs="*",
+                            help="IDs, noms ou motifs de noms (*, ?) des VM")
+        parser.add_argument("--all", "-a", action="store_true",
+                            help="Sélectionner toutes les VM")
+        parser.add_argument("--status", "-s", action="append",
+                            choices=[ "running", "stopped", "starting", "stopping" ],
+                            help="Ne garder que les VM dans cet état (répétable)")
+        parser.add_argument("--jobs", "-j", metavar="N", type=int, default=BATCH_JOBS,
+                            help="Nombre de VM traitées simultanément (défaut: %(default)s)")
+
+    def add_wait_arguments(parser, state):
+        parser.add_argument("--wait", "-w", action="store_true",
+                            help=f"Attendre que la VM soit {state}")
+        parser.add_argument("--wait-timeout", metavar="SECONDES", type=float,
+                            default=VM_WAIT_TIMEOUT,
+                            help="Délai d'attente maximal avec --wait (défaut: %(default)s)")
+
     # system
     sp_system = sub.add_parser("system",
                                help="Afficher les informations système de la Freebox")
@@ -1171,6 +3513,8 @@ def parse_args():
                     help="Lister les distributions disponibles depuis des sources externes")
     sp_list_os.add_argument("--check", "-c", action='store_true',
                             help="Vérifier la validité de l'URL")
+    sp_list_os.add_argument("--jobs", "-j", metavar="N", type=int, default=URL_CHECK_JOBS,
+                            help="Nombre de vérifications d'URL simultanées (défaut: %(default)s)")
     sp_list_os.add_argument("--iso", "-i", action='store_true',
                             help="Lister les images ISO d'installation disponibles")
     sp_list_os.add_argument("--os", "-o", type=str,
@@ -1205,11 +3549,36 @@ def parse_args():
                            help="Supprimer l'image disque")
     sp_delete.add_argument("--force", "-f", action='store_true',
                            help="Supprimer même si la VM est en cours d'exécution")
-    sp_delete.add_argument("vm", help="ID ou nom de la VM")
+    sp_delete.add_argument("--wait-timeout", metavar="SECONDES", type=float,
+                           default=VM_WAIT_TIMEOUT,
+                           help="Délai d'attente de l'arrêt avec --force (défaut: %(default)s)")
+    add_batch_arguments(sp_delete)
 
     # console
     sp_console = sub.add_parser("console", help="Ouvrir la console de la VM")
     sp_console.add_argument("vm", help="ID ou nom de la VM")
+    sp_console.add_argument("--attach", metavar="ADRESSE",
+                            help="Se connecter au serveur de console sur ce socket Unix ou HOTE:PORT "
+                                 "(par défaut, celui de la VM s'il existe)")
+    sp_console.add_argument("--read-only", action="store_true",
+                            help="Suivre la console d'un serveur de console sans pouvoir écrire")
+
+    # agent
+    sub.add_parser("agent", help="Garder session, connexions et caches ouverts pour les autres commandes")
+
+    # console-server
+    sp_console_server = sub.add_parser("console-server",
+                                       help="Partager la console de la VM entre plusieurs clients locaux")
+    sp_console_server.add_argument("vm", help="ID ou nom de la VM")
+    sp_console_server.add_argument("--socket", metavar="CHEMIN",
+                                   help="Socket Unix d'écoute (par défaut dans $XDG_RUNTIME_DIR)")
+    sp_console_server.add_argument("--listen", "-l", metavar="ADDR", default="127.0.0.1",
+                                   help="Adresse d'écoute avec --port (par défaut 127.0.0.1)")
+    sp_console_server.add_argument("--port", "-p", type=int,
+                                   help="Écouter sur ce port TCP plutôt que sur un socket Unix")
+    sp_console_server.add_argument("--metrics", metavar="[ADDR:]PORT", type=metrics_address,
+                                   help="Servir les métriques Prometheus sur http://ADDR:PORT/metrics "
+                                        "(par défaut ADDR est 127.0.0.1)")
 
     # install
     sp_install = sub.add_parser("install", help="Installer une nouvelle VM")
@@ -1250,7 +3619,7 @@ def parse_args():
     # vnx-proxy
     sp_vnc = sub.add_parser("vnc-proxy",
                             help="Exposer le VNC de la VM sur un port TCP local")
-    sp_vnc.add_argument("vm", help="ID ou nom de la VM")
+    sp_vnc.add_argument("vm", nargs="?", help="ID ou nom de la VM")
     sp_vnc.add_argument("--listen", "-l", metavar="ADDR", default="127.0.0.1",
                         help="Adresse d'écoute (par défaut 127.0.0.1)")
     sp_vnc.add_argument("--port", "-p", metavar="N", type=int, default=5901,
@@ -1258,9 +3627,55 @@ def parse_args():
     sp_vnc.add_argument("--console", action="store_true",
                         help="Attacher également la console de la VM")
 
+    def port_range(value):
+        try:
+            first, last = (int(port) for port in value.split("-"))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"plage de ports invalide : {value}")
+        return first, last
+
+    def port_map(value):
+        port, _, selector = value.partition("=")
+        if not port.isdigit() or not selector:
+            raise argparse.ArgumentTypeError(f"association invalide : {value}")
+        return int(port), selector
+
+    def idle_delay(value):
+        try:
+            seconds = float(value)
+        except ValueError:
+            seconds = 0
+        if not seconds > 0:
+            raise argparse.ArgumentTypeError(f"durée invalide : {value}")
+        return seconds
+
+    def read_size_kib(value):
+        try:
+            kib = int(value)
+        except ValueError:
+            kib = 0
+        if kib <= 0:
+            raise argparse.ArgumentTypeError(f"taille invalide : {value}")
+        return kib
+
+    sp_vnc.add_argument("--port-range", metavar="DÉBUT-FIN", type=port_range,
+                        help="Servir toutes les VM démarrées, la VM n sur le port DÉBUT+n")
+    sp_vnc.add_argument("--port-map", metavar="PORT=VM", type=port_map,
+                        action="append", default=[],
+                        help="Servir la VM (ID ou nom) sur ce port quand elle est démarrée (répétable)")
+    sp_vnc.add_argument("--prewarm", metavar="N", type=int, default=0,
+                        help="Garder N connexions VNC ouvertes d'avance par VM (défaut: %(default)s)")
+    sp_vnc.add_argument("--max-idle", metavar="SECONDES", type=idle_delay, default=VNC_POOL_MAX_IDLE,
+                        help="Durée maximale d'une connexion pré-établie inutilisée (défaut: %(default)s)")
+    sp_vnc.add_argument("--read-size", metavar="KIO", type=read_size_kib, default=VNC_READ_SIZE // 1024,
+                        help="Taille maximale des lectures du client VNC, en Kio (défaut: %(default)s)")
+    sp_vnc.add_argument("--metrics", metavar="[ADDR:]PORT", type=metrics_address,
+                        help="Servir les métriques Prometheus sur http://ADDR:PORT/metrics "
+                             "(par défaut ADDR est 127.0.0.1)")
+
     # poweron
     sp_poweron = sub.add_parser("poweron", help="Allumer une VM")
-    sp_poweron.add_argument("vm", help="ID ou nom de la VM")
+    add_batch_arguments(sp_poweron)
     sp_poweron.add_argument("--console", "-c", action="store_true",
                             help="Attacher également la console de la VM")
     sp_poweron.add_argument("--vnc-proxy", "-v", action="store_true",
@@ -1269,30 +3684,33 @@ def parse_args():
                             help="Adresse d'écoute (par défaut 127.0.0.1)")
     sp_poweron.add_argument("--port", "-p", metavar="N", type=int, default=5901,
                             help="Port TCP local (par défaut 5901)")
+    add_wait_arguments(sp_poweron, "démarrée")
 
     # poweroff
     sp_poweroff = sub.add_parser("poweroff",
                                  help="Éteindre une VM")
     sp_poweroff.add_argument("--force", "-f", action='store_true',
                             help="Forcer l'arrêt de la VM")
-    sp_poweroff.add_argument("vm", help="ID ou nom de la VM")
+    add_batch_arguments(sp_poweroff)
+    add_wait_arguments(sp_poweroff, "arrêtée")
 
     # reset
     sp_reset = sub.add_parser("reset", help="Redémarrer une VM")
-    sp_reset.add_argument("vm", help="ID ou nom de la VM")
+    add_batch_arguments(sp_reset)
+    add_wait_arguments(sp_reset, "de nouveau démarrée")
 
     # download
     sp_download = sub.add_parser("download", help="Télécharger une image disque/CDROM")
     sp_download.add_argument("--iso", "-i", action='store_true',
                              help="Sélectionner une ISO plutôt qu'une image disque")
-    sp_download.add_argument("short_id", metavar="short-id", nargs="?",
-                             type=str, help="Identifiant court de la distribution")
+    sp_download.add_argument("short_id", metavar="short-id", nargs="*",
+                             type=str, help="Identifiants courts des distributions")
     sp_download.add_argument("--background", "-b", action='store_true',
                              help="Télécharger en arrière-plan")
-    sp_download.add_argument("--url", "-u", type=str,
-                             help="Ne pas utiliser l'identifiant court ; fournir l'URL")
-    sp_download.add_argument("--hash", "-a", type=str,
-                             help="Ne pas utiliser l'identifiant court ; fournir le hash")
+    sp_download.add_argument("--url", "-u", type=str, action="append",
+                             help="Ne pas utiliser l'identifiant court ; fournir l'URL (répétable)")
+    sp_download.add_argument("--hash", "-a", type=str, action="append",
+                             help="Ne pas utiliser l'identifiant court ; fournir le hash de chaque --url (répétable)")
     sp_download.add_argument("--filename", "-f", type=str,
                              help="Nom de fichier à utiliser")
     sp_download.add_argument("--directory", "-d", type=str,
@@ -1334,9 +3752,41 @@ def main():
 
     args = parse_args()
 
+    if args.api_url:
+        try:
+            api_configure(args.api_url)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(2)
+    http_configure(args.pool_size, dict(args.timeout))
+    api_policy_configure(args.retries, args.rate_limit, args.circuit_breaker)
+    _cache["disabled"] = args.no_cache
+    if args.trace:
+        try:
+            trace_open(args.trace, args.trace_format)
+        except OSError as e:
+            print(f"Impossible d'ouvrir la trace {args.trace}: {e}", file=sys.stderr)
+            sys.exit(2)
+
+    try:
+        run(args)
+    finally:
+        trace_close()
+        if args.http_stats:
+            connections, nrequests = http_stats()
+            print(f"HTTP : {nrequests} requêtes, {connections} connexions ouvertes",
+                  file=sys.stderr)
+
+def run(args):
+
     token_file = args.token_file
 
-    session_token = freebox_connect(token_file)
+    session_token = None
+    if args.cmd != "agent" and not args.no_agent:
+        _session["token_file"] = token_file
+        session_token = agent_connect()
+    if not session_token:
+        session_token = freebox_connect(token_file)
     if not session_token:
         print("Freebox inaccessible.")
         return
@@ -1365,6 +3815,12 @@ def main():
     if args.cmd == "console":
         console(session_token, args)
 
+    if args.cmd == "console-server":
+        console_server(session_token, args)
+
+    if args.cmd == "agent":
+        asyncio.run(run_agent(session_token, runtime_socket_path("agent")))
+
     if args.cmd == "poweron":
         poweron(session_token, args)
 